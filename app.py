@@ -1,84 +1,212 @@
 import os
-import shutil
 import csv
 import json
 import re
+import io
+import queue
+import tempfile
+import zipfile
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, send_from_directory
+from flask import Flask, Request, render_template, request, redirect, url_for, flash, jsonify, send_file, send_from_directory, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import logging
 
+from events import EVENTS_DB, EventBroadcaster, latest_event_id, read_events_since
+import roster
+import bulk_import
+import thumbnails
+from storage import atomic_save, atomic_write, locked
+
+class UploadRequest(Request):
+    """
+    Request that allows large archives on the bulk import route only.
+    """
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'bulk_upload':
+            return app.config['BULK_MAX_CONTENT_LENGTH']
+        return super().max_content_length
+
 app = Flask(__name__)
-app.secret_key = 'your_secret_key_here'  # For flash messages
+app.request_class = UploadRequest
+# For flash messages; set SECRET_KEY in production so every worker shares it
+app.secret_key = os.environ.get('SECRET_KEY', 'your_secret_key_here')
 
 UPLOAD_FOLDER = 'Training_images'
-STATIC_FOLDER = 'static/Training_images'
+THUMBNAIL_FOLDER = thumbnails.THUMBNAIL_FOLDER
+BULK_UPLOAD_FOLDER = 'bulk_uploads'
 ATTENDANCE_FILE = 'Attendance.csv'
 STATS_FILE = 'attendance_stats.json'
+ROSTER_DB = roster.ROSTER_DB
+ATTENDANCE_FIELDS = ['StudentID', 'Name', 'RollNo', 'Date', 'Time']
+STUDENTS_PER_PAGE = 48
+THUMBNAIL_MAX_AGE = 365 * 24 * 60 * 60  # URLs carry the image version, so cache for a year
+SSE_KEEPALIVE_SECONDS = 15
+SSE_REPLAY_BATCH = 500
+EVENTS_POLL_INTERVAL_MS = 5000  # How often browsers without a stream poll for events
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['STATIC_FOLDER'] = STATIC_FOLDER
+app.config['THUMBNAIL_FOLDER'] = THUMBNAIL_FOLDER
+app.config['BULK_UPLOAD_FOLDER'] = BULK_UPLOAD_FOLDER
 app.config['ATTENDANCE_FILE'] = ATTENDANCE_FILE
+app.config['EVENTS_DB'] = EVENTS_DB
+app.config['ROSTER_DB'] = ROSTER_DB
 app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024  # 5MB file size limit
+app.config['BULK_MAX_CONTENT_LENGTH'] = 4 * 1024 * 1024 * 1024  # 4GB limit for bulk ZIP imports
+# Each event stream holds a worker thread while the page is open; dashboards
+# beyond this many per process poll instead. Keep gunicorn --threads above it.
+app.config['SSE_MAX_STREAMS'] = int(os.environ.get('SSE_MAX_STREAMS', 4))
 
 # Ensure directories exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(STATIC_FOLDER, exist_ok=True)
+os.makedirs(THUMBNAIL_FOLDER, exist_ok=True)
+os.makedirs(BULK_UPLOAD_FOLDER, exist_ok=True)
 
-def get_image_files(directory):
+def get_student_details():
     """
-    Get all image files from the specified directory.
-    Supports common image file extensions.
+    Get student details from the student roster.
+    
+    Returns a list of dictionaries with student information:
+    - id: immutable roster id
+    - name: student name
+    - roll_no: student roll number
+    - image: path of the student's primary image, relative to Training_images
+    - images: paths of all the student's images
     """
-    image_extensions = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff'}
-    return [
-        f for f in os.listdir(directory) 
-        if os.path.isfile(os.path.join(directory, f)) 
-        and os.path.splitext(f)[1].lower() in image_extensions
-    ]
+    return roster.list_students(ROSTER_DB)
 
-def get_student_details():
+def get_student_page():
     """
-    Get student details from image filenames in Training_images.
+    Get one page of students, selected by the 'page' query parameter.
     
-    Returns a list of dictionaries with student information:
-    - name: extracted from filename
-    - image: filename of the image
-    - roll_no: extracted from filename (assuming format like RollNo_Name.jpg)
+    Returns the students and a pagination dictionary with page, pages
+    and total for the pagination controls.
     """
-    students = []
-    images = get_image_files(UPLOAD_FOLDER)
+    total = roster.count_students(ROSTER_DB)
+    pages = max(1, -(-total // STUDENTS_PER_PAGE))
+    page = min(max(request.args.get('page', 1, type=int), 1), pages)
     
-    for image in images:
-        # Split filename into parts
-        parts = os.path.splitext(image)[0].split('_')
-        
-        # Check if the first part looks like a roll number (all digits)
-        if parts[0].isdigit():
-            roll_no = parts[0]
-            name = ' '.join(parts[1:]).title()
-        else:
-            # If no roll number found, use a placeholder or empty string
-            roll_no = 'N/A'
-            name = os.path.splitext(image)[0].replace('_', ' ').title()
-        
-        students.append({
-            'name': name,
-            'image': image,
-            'roll_no': roll_no
-        })
+    students = roster.list_students(ROSTER_DB, limit=STUDENTS_PER_PAGE,
+                                    offset=(page - 1) * STUDENTS_PER_PAGE)
+    return students, {'page': page, 'pages': pages, 'total': total}
+
+def training_image_path(image):
+    """
+    Resolve an image path relative to Training_images.
+    
+    Returns None if the path would point outside Training_images.
+    """
+    root = os.path.realpath(UPLOAD_FOLDER)
+    path = os.path.realpath(os.path.join(root, image))
+    if os.path.commonpath([root, path]) != root or path == root:
+        return None
+    return path
+
+def save_student_image(file, name, rollno):
+    """
+    Save an uploaded image to Training_images and generate its thumbnails.
     
-    return students
+    Each upload gets a new unique filename, so it never replaces another photo.
+    Returns the stored filename, relative to Training_images.
+    Raises an error, leaving nothing behind, if the file is not a readable image.
+    """
+    filename = secure_filename(file.filename)
+    file_ext = os.path.splitext(filename)[1]
+    new_filename = roster.new_image_path(name, rollno, file_ext)
+    if training_image_path(new_filename) is None:
+        raise ValueError(f"Image path {new_filename} is outside {UPLOAD_FOLDER}")
+    
+    file_path = os.path.join(UPLOAD_FOLDER, new_filename)
+    atomic_save(file_path, file.save)
+    
+    try:
+        thumbnails.generate_thumbnails(file_path, new_filename, THUMBNAIL_FOLDER)
+    except Exception:
+        remove_student_image(new_filename)
+        raise
+    return new_filename
+
+def remove_student_image(image):
+    """
+    Remove an image from Training_images along with its thumbnails,
+    and its student directory once that is empty.
+    """
+    path = os.path.join(UPLOAD_FOLDER, image)
+    if os.path.exists(path):
+        os.remove(path)
+    directory = os.path.dirname(path)
+    if os.path.normpath(directory) != os.path.normpath(UPLOAD_FOLDER) and os.path.isdir(directory) \
+            and not os.listdir(directory):
+        os.rmdir(directory)
+    thumbnails.remove_thumbnails(image, THUMBNAIL_FOLDER)
+
+@app.template_global()
+def thumbnail_url(image, size='small'):
+    """
+    URL of an image thumbnail, versioned by the image's modification time
+    so browsers can cache it indefinitely. Returns None for a student
+    without an image.
+    """
+    if not image:
+        return None
+    try:
+        version = int(os.path.getmtime(os.path.join(UPLOAD_FOLDER, image)))
+    except OSError:
+        version = 0
+    return url_for('thumbnail', size=size, image=image, v=version)
+
+def migrate_attendance_student_ids():
+    """
+    Link attendance rows without a StudentID to students by name and roll
+    number. Rows written before the roster existed, including ones the
+    recognizer carried over with a blank StudentID, are picked up on the
+    next start; rows that match no student stay unlinked and are retried.
+    """
+    with locked(ATTENDANCE_FILE):
+        try:
+            with open(ATTENDANCE_FILE, 'r') as csvfile:
+                attendance_data = list(csv.DictReader(csvfile))
+        except FileNotFoundError:
+            return
+        
+        unlinked = [record for record in attendance_data if not record.get('StudentID')]
+        if not unlinked:
+            return
+        
+        students = {
+            (student['name'].upper(), student['roll_no']): student['id']
+            for student in get_student_details()
+        }
+        linked = 0
+        for record in unlinked:
+            student_id = students.get(((record.get('Name') or '').upper(), record.get('RollNo') or ''))
+            if student_id is not None:
+                record['StudentID'] = student_id
+                linked += 1
+        
+        if linked:
+            write_attendance_data(attendance_data)
+    logging.info(f"Linked {linked} of {len(unlinked)} unlinked attendance records to student ids")
 
 def read_attendance_data():
     """
     Read attendance data from CSV file.
+    Names and roll numbers are resolved through the roster by StudentID,
+    so rows reflect the student's current details.
     """
     attendance_data = []
     try:
         with open(ATTENDANCE_FILE, 'r') as csvfile:
             csvreader = csv.DictReader(csvfile)
             attendance_data = list(csvreader)
+            
+            students = {str(student['id']): student for student in get_student_details()}
+            for record in attendance_data:
+                student = students.get(record.get('StudentID') or '')
+                if student:
+                    record['Name'] = student['name'].upper()
+                    record['RollNo'] = student['roll_no']
+            
             # Sort by date and time in descending order
             attendance_data.sort(key=lambda x: (x['Date'], x['Time']), reverse=True)
     except FileNotFoundError:
@@ -88,14 +216,43 @@ def read_attendance_data():
     
     return attendance_data
 
+def count_today_attendance():
+    """
+    Count today's attendance records in the attendance CSV.
+    """
+    today = datetime.now().strftime('%Y-%m-%d')
+    try:
+        with open(ATTENDANCE_FILE, 'r') as csvfile:
+            csvreader = csv.DictReader(csvfile)
+            return sum(1 for record in csvreader if record['Date'] == today)
+    except FileNotFoundError:
+        return 0
+    except Exception as e:
+        print(f"Error reading attendance file: {e}")
+        return 0
+
+def attendance_snapshot():
+    """
+    Today's attendance count and the id of the last event it includes.
+    
+    Attendance is published under the attendance file lock, so reading
+    both under the same lock gives a consistent pair.
+    """
+    with locked(ATTENDANCE_FILE):
+        return count_today_attendance(), latest_event_id(app.config['EVENTS_DB'])
+
+# One broadcaster per process polls the event table for all connected browsers
+broadcaster = EventBroadcaster(EVENTS_DB, attendance_snapshot)
+
 def write_attendance_data(attendance_data):
     """
     Write attendance data to CSV file.
+    The file is replaced atomically; callers doing a read-modify-write
+    must hold locked(ATTENDANCE_FILE) around both steps.
     """
     try:
-        with open(ATTENDANCE_FILE, 'w', newline='') as csvfile:
-            fieldnames = ['Name', 'Date', 'Time']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        with atomic_write(ATTENDANCE_FILE, 'w', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=ATTENDANCE_FIELDS, extrasaction='ignore')
             writer.writeheader()
             writer.writerows(attendance_data)
     except Exception as e:
@@ -106,86 +263,65 @@ def update_attendance_stats(name):
     Update and maintain attendance statistics.
     """
     try:
-        if os.path.exists(STATS_FILE):
-            with open(STATS_FILE, 'r') as f:
-                stats = json.load(f)
-        else:
-            stats = {}
+        with locked(STATS_FILE):
+            _update_attendance_stats(name)
+    except Exception as e:
+        print(f"Error updating attendance stats: {e}")
 
-        today = datetime.now().strftime('%Y-%m-%d')
-        
-        if name not in stats:
-            stats[name] = {
-                'total_days': 1,
-                'first_attendance': today,
-                'last_attendance': today,
-                'consecutive_days': 1
-            }
+def _update_attendance_stats(name):
+    """
+    Read-modify-write of the statistics file; the caller holds its lock.
+    """
+    if os.path.exists(STATS_FILE):
+        with open(STATS_FILE, 'r') as f:
+            stats = json.load(f)
+    else:
+        stats = {}
+
+    today = datetime.now().strftime('%Y-%m-%d')
+    
+    if name not in stats:
+        stats[name] = {
+            'total_days': 1,
+            'first_attendance': today,
+            'last_attendance': today,
+            'consecutive_days': 1
+        }
+    else:
+        stats[name]['total_days'] += 1
+        stats[name]['last_attendance'] = today
+        
+        # Check consecutive days
+        last_date = datetime.strptime(stats[name]['last_attendance'], '%Y-%m-%d')
+        if last_date.date() == (datetime.now().date() - timedelta(days=1)):
+            stats[name]['consecutive_days'] += 1
         else:
-            stats[name]['total_days'] += 1
-            stats[name]['last_attendance'] = today
-            
-            # Check consecutive days
-            last_date = datetime.strptime(stats[name]['last_attendance'], '%Y-%m-%d')
-            if last_date.date() == (datetime.now().date() - timedelta(days=1)):
-                stats[name]['consecutive_days'] += 1
-            else:
-                stats[name]['consecutive_days'] = 1
+            stats[name]['consecutive_days'] = 1
 
-        with open(STATS_FILE, 'w') as f:
-            json.dump(stats, f, indent=4)
-    except Exception as e:
-        print(f"Error updating attendance stats: {e}")
+    with atomic_write(STATS_FILE, 'w') as f:
+        json.dump(stats, f, indent=4)
 
-def update_student_references(old_name, old_roll_no, new_name, new_roll_no, old_filename, new_filename):
+def update_student_references(student_id, new_name, new_roll_no):
     """
-    Comprehensively update student references across multiple files.
+    Update a student's name and roll number in the roster.
+    
+    Attendance rows reference the immutable student id, so no other file
+    needs rewriting and image files keep their names.
     
     Args:
-        old_name (str): Original student name
-        old_roll_no (str): Original student roll number
+        student_id (int): Roster id of the student
         new_name (str): Updated student name
         new_roll_no (str): Updated student roll number
-        old_filename (str): Original image filename
-        new_filename (str): Updated image filename
     """
     try:
-        # Update Attendance CSV
-        attendance_updated = False
-        with open(ATTENDANCE_FILE, 'r') as csvfile:
-            reader = csv.DictReader(csvfile)
-            attendance_data = list(reader)
-        
-        for record in attendance_data:
-            if record['Name'] == old_name and record['RollNo'] == old_roll_no:
-                record['Name'] = new_name
-                record['RollNo'] = new_roll_no
-                record['Image'] = new_filename
-                attendance_updated = True
-        
-        if attendance_updated:
-            with open(ATTENDANCE_FILE, 'w', newline='') as csvfile:
-                fieldnames = attendance_data[0].keys()
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(attendance_data)
-        
-        # Rename image files in Training_images and static folders
-        old_upload_path = os.path.join(UPLOAD_FOLDER, old_filename)
-        old_static_path = os.path.join(STATIC_FOLDER, old_filename)
+        student = roster.get_student(ROSTER_DB, student_id)
+        if student is None:
+            raise ValueError(f"Unknown student id {student_id}")
         
-        new_upload_path = os.path.join(UPLOAD_FOLDER, new_filename)
-        new_static_path = os.path.join(STATIC_FOLDER, new_filename)
+        roster.update_student(ROSTER_DB, student_id, new_name, new_roll_no)
         
-        # Rename files if they exist
-        if os.path.exists(old_upload_path):
-            os.rename(old_upload_path, new_upload_path)
-        
-        if os.path.exists(old_static_path):
-            os.rename(old_static_path, new_static_path)
-        
-        # Optional: Log the update
-        logging.info(f"Updated student: {old_name} (Roll No: {old_roll_no}) -> {new_name} (Roll No: {new_roll_no})")
+        logging.info(f"Updated student {student_id}: {student['name']} (Roll No: {student['roll_no']}) "
+                     f"-> {new_name} (Roll No: {new_roll_no})")
     
     except Exception as e:
         logging.error(f"Error updating student references: {e}")
@@ -196,31 +332,20 @@ def index():
     """
     Render index page with overall statistics.
     """
-    # Calculate total attendees from Training_images folder
-    total_attendees = len(get_image_files(UPLOAD_FOLDER))
+    # Calculate total attendees from the student roster
+    total_attendees = roster.count_students(ROSTER_DB)
 
     # Calculate today's attendance from Attendance.csv
-    today = datetime.now().strftime('%Y-%m-%d')
-    
-    # Read attendance data directly from CSV
-    today_attendees = 0
-    try:
-        with open(ATTENDANCE_FILE, 'r') as csvfile:
-            csvreader = csv.DictReader(csvfile)
-            today_attendees = sum(1 for record in csvreader if record['Date'] == today)
-    except FileNotFoundError:
-        today_attendees = 0
-    except Exception as e:
-        print(f"Error reading attendance file: {e}")
-        today_attendees = 0
+    today_attendees = count_today_attendance()
 
-    # Get student details
-    students = get_student_details()
+    # Get one page of student details
+    students, pagination = get_student_page()
 
     return render_template('index.html', 
                            total_attendees=total_attendees, 
                            today_attendees=today_attendees,
-                           students=students)
+                           students=students,
+                           pagination=pagination)
 
 @app.route('/upload_students')
 def upload_students():
@@ -228,33 +353,26 @@ def upload_students():
     Render upload students page with image gallery.
     Includes student details with roll numbers.
     """
-    images = get_image_files(UPLOAD_FOLDER)
-    
-    # Get student details to map images to roll numbers and names
-    students = get_student_details()
-    student_details = {student['image']: student for student in students}
-    
-    # Augment images with student details
+    # One gallery entry per image, labelled with its student's details
+    students, pagination = get_student_page()
     image_details = []
-    for image in images:
-        details = student_details.get(image, {
-            'name': image.split('.')[0].replace('_', ' ').title(),
-            'roll_no': 'N/A'
-        })
-        image_details.append({
-            'filename': image,
-            'name': details['name'],
-            'roll_no': details.get('roll_no', 'N/A')
-        })
+    for student in students:
+        for image in student['images']:
+            image_details.append({
+                'filename': image,
+                'name': student['name'],
+                'roll_no': student['roll_no']
+            })
     
     return render_template('upload_students.html', 
-                           images=image_details)
+                           images=image_details,
+                           pagination=pagination)
 
 @app.route('/upload', methods=['POST'])
 def upload():
     """
     Handle student/employee image upload.
-    Creates a filename with roll number and name.
+    Stores the image in the student's roll number and name directory.
     """
     if 'file' not in request.files:
         flash('No file part', 'danger')
@@ -284,42 +402,103 @@ def upload():
         return redirect(url_for('upload_students'))
     
     if file:
-        # Sanitize filename
-        filename = secure_filename(file.filename)
-        file_ext = os.path.splitext(filename)[1]
-        
-        # Create new filename with roll number and name
-        new_filename = f"{rollno}_{name.replace(' ', '_')}{file_ext}"
-        
-        # Save to Training_images
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], new_filename)
-        file.save(file_path)
-        
-        # Copy to static folder for web display
-        static_path = os.path.join(app.config['STATIC_FOLDER'], new_filename)
-        shutil.copy(file_path, static_path)
+        if not allowed_file(file.filename):
+            flash('Invalid file type. Please upload an image.', 'danger')
+            return redirect(url_for('upload_students'))
+        
+        # Check and register under the roster lock so concurrent workers
+        # cannot enroll the same roll number twice
+        with locked(ROSTER_DB):
+            # A roll number belongs to one student; a matching upload adds another photo
+            student = roster.find_by_roll_no(ROSTER_DB, rollno)
+            if student and student['name'].lower() != name.lower():
+                flash(f"Roll number {rollno} is already registered to {student['name']}", 'danger')
+                return redirect(url_for('upload_students'))
+            
+            try:
+                new_filename = save_student_image(file, name, rollno)
+            except Exception as e:
+                flash(f'Could not read image: {str(e)}', 'danger')
+                return redirect(url_for('upload_students'))
+            
+            if student:
+                roster.add_image(ROSTER_DB, student['id'], new_filename)
+            else:
+                roster.add_student(ROSTER_DB, name.title(), rollno, [new_filename])
         
         flash('Image uploaded successfully!', 'success')
         return redirect(url_for('upload_students'))
 
-@app.route('/delete_image/<filename>', methods=['POST'])
+def bulk_import_config():
+    """
+    Folder and database paths handed to the bulk import worker.
+    """
+    return {key: app.config[key] for key in
+            ('UPLOAD_FOLDER', 'THUMBNAIL_FOLDER', 'ROSTER_DB', 'BULK_UPLOAD_FOLDER')}
+
+@app.route('/bulk_upload', methods=['POST'])
+def bulk_upload():
+    """
+    Enroll many students from a ZIP of photos and an optional CSV roster.
+    
+    The archive is streamed to a temporary file and queued; extraction,
+    validation and encoding run in the background. Returns the job id
+    and its status URL.
+    """
+    archive = request.files.get('archive')
+    if archive is None or archive.filename == '':
+        return jsonify({'error': 'No ZIP archive uploaded'}), 400
+    
+    csv_names, csv_errors = {}, []
+    roster_csv = request.files.get('roster')
+    if roster_csv and roster_csv.filename:
+        try:
+            csv_names, csv_errors = bulk_import.read_roster_csv(roster_csv.stream)
+        except UnicodeDecodeError:
+            return jsonify({'error': 'Roster CSV must be UTF-8 encoded'}), 400
+        except csv.Error as e:
+            return jsonify({'error': f'Could not read roster CSV: {e}'}), 400
+    
+    fd, archive_path = tempfile.mkstemp(prefix='bulk_', suffix='.zip', dir=BULK_UPLOAD_FOLDER)
+    os.close(fd)
+    archive.save(archive_path)
+    
+    if not zipfile.is_zipfile(archive_path):
+        os.remove(archive_path)
+        return jsonify({'error': 'Uploaded file is not a ZIP archive'}), 400
+    
+    job_id = bulk_import.submit_import(archive_path, csv_names, csv_errors, bulk_import_config())
+    logging.info(f"Queued bulk import {job_id} from {archive.filename}")
+    
+    return jsonify({'job_id': job_id, 'status_url': url_for('bulk_upload_status', job_id=job_id)}), 202
+
+@app.route('/bulk_upload/<job_id>')
+def bulk_upload_status(job_id):
+    """
+    Report progress of a bulk import job.
+    """
+    job = bulk_import.get_job(app.config['ROSTER_DB'], job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown import job'}), 404
+    return jsonify(job)
+
+@app.route('/delete_image/<path:filename>', methods=['POST'])
 def delete_image(filename):
     """
-    Delete an image from Training_images and static/Training_images
+    Delete a registered image and its thumbnails
     """
-    try:
-        # Remove from Training_images
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        static_file_path = os.path.join(app.config['STATIC_FOLDER'], filename)
+    with locked(ROSTER_DB):
+        # Only images in the roster may be deleted; anything else is treated as missing
+        if not roster.find_by_image(ROSTER_DB, filename) or training_image_path(filename) is None:
+            return 'Image not found', 404
         
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        if os.path.exists(static_file_path):
-            os.remove(static_file_path)
-        
-        flash(f"Image {filename} deleted successfully!", 'success')
-    except Exception as e:
-        flash(f"Error deleting image: {str(e)}", 'error')
+        try:
+            remove_student_image(filename)
+            roster.remove_image(ROSTER_DB, filename)
+            
+            flash(f"Image {filename} deleted successfully!", 'success')
+        except Exception as e:
+            flash(f"Error deleting image: {str(e)}", 'error')
     
     return redirect(url_for('upload_students'))
 
@@ -343,7 +522,7 @@ def attendance_records():
     ]
 
     # Calculate attendance statistics
-    total_students = len(get_student_details())
+    total_students = roster.count_students(ROSTER_DB)
     attended_count = len(filtered_attendance)
     absent_count = total_students - attended_count
     attendance_percentage = round((attended_count / total_students * 100), 2) if total_students > 0 else 0
@@ -361,6 +540,89 @@ def attendance_records():
                            selected_date=selected_date,
                            today_date=today_date)
 
+def format_sse(data, event_id=None):
+    """
+    Format a dictionary as a server-sent event message.
+    """
+    message = f"data: {json.dumps(data)}\n\n"
+    if event_id is not None:
+        message = f"id: {event_id}\n" + message
+    return message
+
+@app.route('/events')
+def attendance_events():
+    """
+    Stream attendance events to the browser as server-sent events.
+    
+    Sends the current counters first, replays anything missed since the
+    browser's Last-Event-ID, then pushes each new event as it is published.
+    
+    Each stream holds a worker thread, so at most SSE_MAX_STREAMS are
+    served per process; beyond that the request is refused with 503 and
+    the page falls back to polling /events/poll.
+    """
+    subscriber = broadcaster.subscribe(app.config['SSE_MAX_STREAMS'])
+    if subscriber is None:
+        return Response('Too many event streams, poll instead', status=503,
+                        headers={'Retry-After': str(EVENTS_POLL_INTERVAL_MS // 1000)})
+    last_event_id = request.headers.get('Last-Event-ID', '')
+
+    def stream():
+        try:
+            yield format_sse({'type': 'snapshot', 'counters': broadcaster.counters()})
+
+            # Highest event id sent so far; events published between subscribing
+            # and the replay arrive both ways and must only be sent once
+            sent_id = 0
+            if last_event_id.isdigit():
+                sent_id = int(last_event_id)
+                # Replay in batches until caught up, however far behind the browser is
+                while True:
+                    events = read_events_since(app.config['EVENTS_DB'], sent_id, SSE_REPLAY_BATCH)
+                    for event in events:
+                        event['counters'] = broadcaster.counters()
+                        sent_id = event['id']
+                        yield format_sse(event, event['id'])
+                    if len(events) < SSE_REPLAY_BATCH:
+                        break
+
+            while broadcaster.is_subscribed(subscriber):
+                try:
+                    event = subscriber.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing the idle connection
+                    yield ': keepalive\n\n'
+                    continue
+                if event['id'] <= sent_id:
+                    continue
+                sent_id = event['id']
+                yield format_sse(event, event['id'])
+        finally:
+            broadcaster.unsubscribe(subscriber)
+
+    return Response(stream_with_context(stream()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/events/poll')
+def attendance_events_poll():
+    """
+    Polling fallback for pages that could not open an event stream.
+    
+    Returns events newer than the 'after' query parameter (none when it is
+    missing), the id to pass as 'after' next time, the current counters
+    and the suggested polling interval. Recent events come from the
+    broadcaster's memory, so polling does not touch the database.
+    """
+    after = request.args.get('after', type=int)
+    events, last_id, counters = broadcaster.recent_events(after)
+    if events is None:
+        events = read_events_since(app.config['EVENTS_DB'], after, SSE_REPLAY_BATCH)
+        if len(events) == SSE_REPLAY_BATCH:
+            last_id = events[-1]['id']
+    
+    return jsonify({'events': events, 'last_id': last_id, 'counters': counters,
+                    'retry_ms': EVENTS_POLL_INTERVAL_MS})
+
 @app.route('/download_attendance')
 def download_attendance():
     """
@@ -379,8 +641,14 @@ def download_attendance():
         today = datetime.now().strftime('%Y-%m-%d')
         download_filename = f'Attendance_{today}.csv'
         
+        # Export with current student names resolved from the roster
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=ATTENDANCE_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(read_attendance_data())
+        
         return send_file(
-            ATTENDANCE_FILE, 
+            io.BytesIO(output.getvalue().encode('utf-8')), 
             as_attachment=True, 
             download_name=download_filename,
             mimetype='text/csv'
@@ -395,14 +663,38 @@ def manage_students():
     """
     Render manage students page with list of students and their details.
     """
-    # Get student details with their images
-    students = get_student_details()
+    # Get one page of student details with their images
+    students, pagination = get_student_page()
     
-    # Augment student details with full image path
-    for student in students:
-        student['image_path'] = os.path.join('Training_images', student['image'])
+    return render_template('manage_students.html', students=students, pagination=pagination)
+
+@app.route('/thumbnail/<size>/<path:image>')
+def thumbnail(size, image):
+    """
+    Serve a student image thumbnail as WebP or JPEG, depending on what
+    the browser accepts, with ETag/Last-Modified and long cache headers.
+    """
+    if size not in thumbnails.THUMBNAIL_SIZES:
+        return 'Unknown thumbnail size', 404
+    
+    source_path = training_image_path(image)
+    if not roster.find_by_image(ROSTER_DB, image) or source_path is None or not os.path.exists(source_path):
+        return 'Image not found', 404
+    
+    ext = thumbnails.pick_format(request.headers.get('Accept'))
+    thumbnails.ensure_thumbnails(source_path, image, THUMBNAIL_FOLDER)
     
-    return render_template('manage_students.html', students=students)
+    response = send_file(
+        os.path.abspath(thumbnails.thumbnail_path(image, size, ext, THUMBNAIL_FOLDER)),
+        mimetype='image/webp' if ext == 'webp' else 'image/jpeg',
+        conditional=True,
+        etag=True,
+        max_age=THUMBNAIL_MAX_AGE
+    )
+    response.vary.add('Accept')
+    if request.args.get('v'):
+        response.cache_control.immutable = True
+    return response
 
 @app.route('/edit_student', methods=['POST'])
 def edit_student():
@@ -412,7 +704,7 @@ def edit_student():
     """
     try:
         # Get form data
-        old_filename = request.form.get('old_filename')
+        student_id = int(request.form.get('student_id', ''))
         new_name = request.form.get('name').strip()
         new_roll_no = request.form.get('rollno').strip()
         
@@ -421,49 +713,40 @@ def edit_student():
             flash('Name and Roll No cannot be empty', 'danger')
             return redirect(url_for('manage_students'))
         
-        # Extract old name and roll no from the filename
-        old_name_match = re.match(r'(\d+)_([^.]+)', old_filename)
-        if old_name_match:
-            old_roll_no, old_name = old_name_match.groups()
-            old_name = old_name.replace('_', ' ')
-        else:
-            flash('Invalid student filename format', 'danger')
+        # Validate name (letters and spaces only)
+        if not re.match(r'^[A-Za-z\s]+$', new_name):
+            flash('Invalid name format', 'danger')
             return redirect(url_for('manage_students'))
         
-        # Generate new filename
-        file_ext = os.path.splitext(old_filename)[1]
-        new_filename = f"{new_roll_no}_{new_name.replace(' ', '_')}{file_ext}"
+        # Validate roll number (digits only)
+        if not re.match(r'^[0-9]+$', new_roll_no):
+            flash('Invalid roll number format', 'danger')
+            return redirect(url_for('manage_students'))
         
-        # Check if file is uploaded
-        file = request.files.get('file')
-        if file and file.filename:
-            # Validate file
-            if not allowed_file(file.filename):
-                flash('Invalid file type. Please upload an image.', 'danger')
+        # Hold the roster lock so a concurrent edit cannot claim the same roll number
+        with locked(ROSTER_DB):
+            student = roster.get_student(ROSTER_DB, student_id)
+            if student is None:
+                flash('Student not found', 'danger')
                 return redirect(url_for('manage_students'))
             
-            # Remove old files
-            old_filepath = os.path.join(UPLOAD_FOLDER, old_filename)
-            old_static_filepath = os.path.join(STATIC_FOLDER, old_filename)
-            
-            if os.path.exists(old_filepath):
-                os.remove(old_filepath)
-            if os.path.exists(old_static_filepath):
-                os.remove(old_static_filepath)
+            other = roster.find_by_roll_no(ROSTER_DB, new_roll_no)
+            if other and other['id'] != student_id:
+                flash(f"Roll number {new_roll_no} is already registered to {other['name']}", 'danger')
+                return redirect(url_for('manage_students'))
             
-            # Save new file
-            new_filepath = os.path.join(UPLOAD_FOLDER, new_filename)
-            new_static_filepath = os.path.join(STATIC_FOLDER, new_filename)
+            # Check if file is uploaded
+            file = request.files.get('file')
+            if file and file.filename:
+                # Validate file
+                if not allowed_file(file.filename):
+                    flash('Invalid file type. Please upload an image.', 'danger')
+                    return redirect(url_for('manage_students'))
+                
+                replace_student_image(student, file, new_name, new_roll_no)
             
-            file.save(new_filepath)
-            shutil.copy(new_filepath, new_static_filepath)
-        
-        # Update references across files
-        update_student_references(
-            old_name, old_roll_no, 
-            new_name, new_roll_no, 
-            old_filename, new_filename
-        )
+            # Renames only touch the roster
+            update_student_references(student_id, new_name, new_roll_no)
         
         flash('Student details updated successfully', 'success')
         return redirect(url_for('manage_students'))
@@ -472,23 +755,33 @@ def edit_student():
         flash(f'Error updating student: {str(e)}', 'danger')
         return redirect(url_for('manage_students'))
 
+def replace_student_image(student, file, name, roll_no):
+    """
+    Replace a student's primary image with an uploaded file.
+    """
+    old_image = student['image']
+    new_filename = save_student_image(file, name, roll_no)
+    
+    roster.add_image(ROSTER_DB, student['id'], new_filename)
+    if old_image:
+        remove_student_image(old_image)
+        roster.remove_image(ROSTER_DB, old_image)
+
 @app.route('/delete_student', methods=['POST'])
 def delete_student():
     """
-    Delete a student's image and details.
+    Delete a student's images and details.
     """
     try:
-        filename = request.form.get('filename')
-        
-        # Delete from Training_images
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-        if os.path.exists(filepath):
-            os.remove(filepath)
+        student_id = int(request.form.get('student_id', ''))
         
-        # Delete from static/Training_images
-        static_filepath = os.path.join(STATIC_FOLDER, filename)
-        if os.path.exists(static_filepath):
-            os.remove(static_filepath)
+        # Hold the roster lock so a concurrent upload cannot attach a photo mid-delete
+        with locked(ROSTER_DB):
+            student = roster.get_student(ROSTER_DB, student_id)
+            if student:
+                for image in student['images']:
+                    remove_student_image(image)
+                roster.delete_student(ROSTER_DB, student['id'])
 
         flash('Student image deleted successfully', 'success')
         return redirect(url_for('manage_students'))
@@ -504,9 +797,7 @@ def update_student_image():
     """
     try:
         # Get form data
-        old_filename = request.form.get('old_filename')
-        name = request.form.get('name')
-        roll_no = request.form.get('rollno')
+        student_id = int(request.form.get('student_id', ''))
         
         # Check if file is uploaded
         if 'file' not in request.files:
@@ -525,25 +816,15 @@ def update_student_image():
             flash('Invalid file type. Please upload an image.', 'danger')
             return redirect(url_for('manage_students'))
         
-        # Generate new filename
-        file_ext = os.path.splitext(file.filename)[1]
-        new_filename = f"{roll_no}_{name.replace(' ', '_')}{file_ext}"
-        
-        # Remove old files
-        old_filepath = os.path.join(UPLOAD_FOLDER, old_filename)
-        old_static_filepath = os.path.join(STATIC_FOLDER, old_filename)
-        
-        if os.path.exists(old_filepath):
-            os.remove(old_filepath)
-        if os.path.exists(old_static_filepath):
-            os.remove(old_static_filepath)
-        
-        # Save new file
-        new_filepath = os.path.join(UPLOAD_FOLDER, new_filename)
-        new_static_filepath = os.path.join(STATIC_FOLDER, new_filename)
-        
-        file.save(new_filepath)
-        shutil.copy(new_filepath, new_static_filepath)
+        # Look the student up under the roster lock so a concurrent delete or edit
+        # cannot leave the new photo orphaned
+        with locked(ROSTER_DB):
+            student = roster.get_student(ROSTER_DB, student_id)
+            if student is None:
+                flash('Student not found', 'danger')
+                return redirect(url_for('manage_students'))
+            
+            replace_student_image(student, file, student['name'], student['roll_no'])
         
         flash('Student image updated successfully', 'success')
         return redirect(url_for('manage_students'))
@@ -560,5 +841,41 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def ensure_all_thumbnails():
+    """
+    Generate missing or outdated thumbnails for every registered image.
+    """
+    for student in get_student_details():
+        for image in student['images']:
+            try:
+                thumbnails.ensure_thumbnails(os.path.join(UPLOAD_FOLDER, image), image, THUMBNAIL_FOLDER)
+            except Exception as e:
+                logging.error(f"Error generating thumbnails for {image}: {e}")
+
+def create_app():
+    """
+    Application factory for running under a multi-worker WSGI server:
+    
+        gunicorn --workers 4 --threads 8 "app:create_app()"
+    
+    or, with the Flask CLI, flask --app "app:create_app()" run. A plain
+    'flask run' picks up the module-level app and skips the startup work.
+    
+    Use threaded workers with more threads than SSE_MAX_STREAMS: each open
+    event stream holds a thread, and pages beyond the limit poll instead, so
+    the remaining threads always serve other requests.
+    
+    Startup maintenance (registering images added outside the app,
+    thumbnails, linking legacy attendance rows, taking over bulk imports
+    left by a dead worker) runs under the roster lock, so workers booting
+    together take turns instead of racing.
+    """
+    with locked(ROSTER_DB):
+        roster.sync_training_images(ROSTER_DB, UPLOAD_FOLDER)
+        ensure_all_thumbnails()
+        migrate_attendance_student_ids()
+        bulk_import.recover_jobs(bulk_import_config())
+    return app
+
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=os.environ.get('FLASK_DEBUG') == '1', threaded=True)
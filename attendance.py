@@ -0,0 +1,87 @@
+import logging
+from datetime import datetime
+from typing import Optional
+
+import pandas as pd
+
+from events import publish_event
+from storage import atomic_save, locked
+
+logger = logging.getLogger(__name__)
+
+ATTENDANCE_COLUMNS = ["StudentID", "Name", "RollNo", "Date", "Time"]
+
+def mark_attendance(
+    student_id: int,
+    name: str,
+    roll_no: str,
+    attendance_file: str,
+    events_db: Optional[str] = None
+):
+    """
+    Mark or update attendance for a recognized person.
+    
+    Rows are matched on the roster id; name and roll number are stored
+    alongside as a snapshot for exports.
+    
+    Args:
+        student_id (int): Roster id of the recognized person
+        name (str): Name of the recognized person
+        roll_no (str): Roll number of the recognized person
+        attendance_file (str): Path to attendance CSV file
+        events_db (str, optional): Event database to publish new attendance to
+    """
+    try:
+        with locked(attendance_file):
+            is_new, date_string, time_string = _update_attendance_file(
+                student_id, name, roll_no, attendance_file)
+
+            # Only first sightings are published; time refreshes would flood the stream.
+            # Publishing under the lock keeps the CSV and the event table in step
+            # for readers that snapshot both.
+            if is_new and events_db:
+                publish_event(events_db, 'attendance_marked', {
+                    'student_id': student_id, 'name': name, 'roll_no': roll_no,
+                    'date': date_string, 'time': time_string
+                })
+    except Exception as e:
+        logger.error(f"Error marking attendance: {e}")
+
+def _update_attendance_file(student_id: int, name: str, roll_no: str, attendance_file: str):
+    """
+    Read-modify-write of the attendance CSV; the caller holds its lock.
+    
+    Returns:
+        Tuple of whether a new row was added, the date and the time
+    """
+    # Check if CSV exists, if not create with new columns
+    try:
+        df = pd.read_csv(attendance_file, dtype=str)
+    except FileNotFoundError:
+        df = pd.DataFrame(columns=ATTENDANCE_COLUMNS)
+
+    if "StudentID" not in df.columns:
+        df["StudentID"] = None
+
+    now = datetime.now()
+    date_string = now.strftime('%Y-%m-%d')
+    time_string = now.strftime('%H:%M:%S')
+
+    # Check for existing entry on the same day
+    mask = (df["StudentID"] == str(student_id)) & (df["Date"] == date_string)
+    
+    is_new = not mask.any()
+    if not is_new:
+        # Update time if already present
+        df.loc[mask, "Time"] = time_string
+        logger.info(f"Updated attendance for {name} (Roll No: {roll_no})")
+    else:
+        # Add new entry
+        new_entry = pd.DataFrame([[str(student_id), name, roll_no, date_string, time_string]], 
+                                 columns=ATTENDANCE_COLUMNS)
+        df = pd.concat([df, new_entry], ignore_index=True)
+        logger.info(f"Marked attendance for {name} (Roll No: {roll_no})")
+
+    # Replace the file in one step so readers never see a partial CSV
+    atomic_save(attendance_file, lambda tmp_path: df.to_csv(tmp_path, index=False))
+    return is_new, date_string, time_string
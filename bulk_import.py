@@ -0,0 +1,407 @@
+import os
+import io
+import csv
+import json
+import uuid
+import sqlite3
+import queue
+import zipfile
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import roster
+import thumbnails
+from storage import atomic_write, locked
+
+try:
+    import face_recognition
+except ImportError:  # Encoding is left to main.py when the CV stack is missing
+    face_recognition = None
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK_SIZE = 64 * 1024
+MAX_IMAGE_SIZE = 5 * 1024 * 1024  # Per photo, matching the single-upload limit
+STALE_ARCHIVE_SECONDS = 60 * 60  # Untracked archives younger than this may still be uploading
+
+JOB_COUNTERS = ('total', 'extracted', 'encoded', 'students_added')
+
+_queue: "queue.Queue[dict]" = queue.Queue()
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    """
+    Open the job table. Job status lives in SQLite rather than process
+    memory so any web worker can answer a status poll.
+    """
+    conn = sqlite3.connect(db_path, timeout=5)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS import_jobs ('
+        'id TEXT PRIMARY KEY, '
+        'status TEXT NOT NULL, '
+        'created_at TEXT NOT NULL, '
+        'total INTEGER NOT NULL DEFAULT 0, '
+        'extracted INTEGER NOT NULL DEFAULT 0, '
+        'encoded INTEGER NOT NULL DEFAULT 0, '
+        'students_added INTEGER NOT NULL DEFAULT 0, '
+        "errors TEXT NOT NULL DEFAULT '[]', "
+        'archive_path TEXT, '
+        'csv_names TEXT, '
+        'owner_pid INTEGER)'
+    )
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(import_jobs)')}
+    for column in ('archive_path TEXT', 'csv_names TEXT', 'owner_pid INTEGER'):
+        if column.split()[0] not in columns:
+            conn.execute(f'ALTER TABLE import_jobs ADD COLUMN {column}')
+    return conn
+
+def _execute(db_path: str, sql: str, params: tuple):
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute(sql, params)
+    finally:
+        conn.close()
+
+def read_roster_csv(stream) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Parse an optional roster CSV with 'roll_no' and 'name' columns.
+
+    Args:
+        stream: Binary file-like object holding the CSV
+
+    Returns:
+        Tuple of a roll number to name mapping and a list of row errors
+    """
+    names, errors = {}, []
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    fields = {field.strip().lower().replace(' ', '_'): field for field in (reader.fieldnames or [])}
+    roll_field = fields.get('roll_no') or fields.get('rollno')
+    name_field = fields.get('name')
+    if not roll_field or not name_field:
+        return {}, ["Roster CSV needs 'roll_no' and 'name' columns"]
+
+    for line, row in enumerate(reader, start=2):
+        roll_no = (row.get(roll_field) or '').strip()
+        name = ' '.join((row.get(name_field) or '').split())
+        if not roster.ROLL_NO_PATTERN.match(roll_no):
+            errors.append(f"CSV line {line}: invalid roll number '{roll_no}'")
+        elif not roster.NAME_PATTERN.match(name):
+            errors.append(f"CSV line {line}: invalid name '{name}'")
+        elif roll_no in names and names[roll_no].lower() != name.lower():
+            errors.append(f"CSV line {line}: roll number {roll_no} listed for both "
+                          f"{names[roll_no]} and {name}")
+        else:
+            names[roll_no] = name.title()
+    return names, errors
+
+def plan_import(archive_path: str, csv_names: Dict[str, str], db_path: str) -> Tuple[List[dict], List[str]]:
+    """
+    Validate every photo in the archive against the CSV and the roster
+    before anything is extracted. Only the ZIP central directory is read.
+
+    A photo is named 'Roll_Name.ext' or stored as 'Roll_Name/photo.ext';
+    with a CSV the name part may be omitted ('Roll.ext' or 'Roll/photo.ext').
+    The filename wins when it identifies a student, so archives made by
+    zipping a whole folder ('class10/101_Ann_Lee.jpg') work; otherwise the
+    parent folder name is used.
+
+    Returns:
+        Tuple of planned entries and a list of validation errors
+    """
+    existing = {student['roll_no']: student for student in roster.list_students(db_path)}
+    planned, errors, import_names = [], [], {}
+
+    with zipfile.ZipFile(archive_path) as archive:
+        for info in archive.infolist():
+            parts = [part for part in info.filename.split('/') if part]
+            if info.is_dir() or not parts or parts[0] == '__MACOSX' or parts[-1].startswith('.'):
+                continue
+            if os.path.splitext(parts[-1])[1].lower() not in roster.IMAGE_EXTENSIONS:
+                continue
+            if info.file_size > MAX_IMAGE_SIZE:
+                errors.append(f"{info.filename}: larger than {MAX_IMAGE_SIZE // (1024 * 1024)} MB")
+                continue
+
+            name, roll_no = roster.parse_student_name(os.path.splitext(parts[-1])[0])
+            if len(parts) > 1 and (roll_no == 'N/A' or not (name or roll_no in csv_names)):
+                name, roll_no = roster.parse_student_name(parts[-2])
+            if roll_no in csv_names:
+                name = csv_names[roll_no]
+            if roll_no == 'N/A' or not roster.ROLL_NO_PATTERN.match(roll_no):
+                errors.append(f"{info.filename}: no roll number in the file or folder name")
+                continue
+            if not name or not roster.NAME_PATTERN.match(name):
+                errors.append(f"{info.filename}: missing or invalid name for roll number {roll_no}")
+                continue
+            if roll_no in import_names and import_names[roll_no].lower() != name.lower():
+                errors.append(f"{info.filename}: roll number {roll_no} used for both "
+                              f"{import_names[roll_no]} and {name}")
+                continue
+            student = existing.get(roll_no)
+            if student and student['name'].lower() != name.lower():
+                errors.append(f"{info.filename}: roll number {roll_no} is already registered "
+                              f"to {student['name']}")
+                continue
+
+            import_names[roll_no] = name
+            planned.append({'entry': info.filename, 'roll_no': roll_no, 'name': name})
+    return planned, errors
+
+def _copy_limited(source, destination, limit: int):
+    """
+    Stream a ZIP member to disk in chunks, refusing to write past limit
+    even if the archive understates the member's size.
+    """
+    written = 0
+    while True:
+        chunk = source.read(COPY_CHUNK_SIZE)
+        if not chunk:
+            return
+        written += len(chunk)
+        if written > limit:
+            raise ValueError('image exceeds size limit')
+        destination.write(chunk)
+
+def submit_import(archive_path: str, csv_names: Dict[str, str], csv_errors: List[str], config: dict) -> str:
+    """
+    Queue a saved archive for background import.
+
+    Args:
+        archive_path (str): Path of the uploaded ZIP, removed when the job ends
+        csv_names (Dict[str, str]): Roll number to name mapping from the CSV
+        csv_errors (List[str]): Errors found while reading the CSV
+        config (dict): Folder and database paths ('UPLOAD_FOLDER', 'THUMBNAIL_FOLDER',
+            'ROSTER_DB', 'BULK_UPLOAD_FOLDER')
+
+    Returns:
+        The job id to poll with get_job()
+    """
+    job_id = uuid.uuid4().hex
+    _execute(config['ROSTER_DB'],
+             'INSERT INTO import_jobs (id, status, created_at, errors, archive_path, csv_names, owner_pid) '
+             'VALUES (?, ?, ?, ?, ?, ?, ?)',
+             (job_id, 'queued', datetime.now().isoformat(timespec='seconds'), json.dumps(csv_errors),
+              archive_path, json.dumps(csv_names), os.getpid()))
+    _enqueue(job_id, archive_path, csv_names, config)
+    return job_id
+
+def _enqueue(job_id: str, archive_path: str, csv_names: Dict[str, str], config: dict):
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_run, name='bulk-import', daemon=True)
+            _worker.start()
+    _queue.put({'id': job_id, 'archive_path': archive_path, 'csv_names': csv_names, 'config': dict(config)})
+
+def _process_alive(pid: Optional[int]) -> bool:
+    """
+    Whether the web worker that owns a job is still running.
+    """
+    if pid is None:
+        return False
+    if pid == os.getpid():
+        return True
+    if os.name == 'nt':
+        # os.kill(pid, 0) would send CTRL_C_EVENT; the Windows dev server is a single process
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def recover_jobs(config: dict):
+    """
+    Take over import jobs whose web worker died, and remove stray archives.
+
+    Jobs live in the memory of the worker that accepted the upload, so a
+    restarted or killed worker leaves them unfinished. A job that had not
+    started is re-queued in this process. A job cut off while extracting
+    is marked failed, since its photos are partly registered. A job cut
+    off while encoding is marked done, because main.py encodes whatever
+    is left. Archives in the upload folder that no live job refers to,
+    and that are not still being uploaded, are deleted. Call with locked(ROSTER_DB) held so workers booting
+    together do not claim the same job.
+
+    Args:
+        config (dict): Folder and database paths, as for submit_import()
+    """
+    db_path = config['ROSTER_DB']
+    conn = _connect(db_path)
+    try:
+        jobs = conn.execute(
+            "SELECT id, status, archive_path, csv_names, owner_pid FROM import_jobs "
+            "WHERE status NOT IN ('done', 'failed')").fetchall()
+    finally:
+        conn.close()
+
+    in_use = set()
+    for job in jobs:
+        if _process_alive(job['owner_pid']):
+            in_use.add(job['archive_path'])
+            continue
+
+        archive_path = job['archive_path']
+        if job['status'] == 'queued' and archive_path and os.path.exists(archive_path):
+            _execute(db_path, 'UPDATE import_jobs SET owner_pid = ? WHERE id = ?', (os.getpid(), job['id']))
+            _enqueue(job['id'], archive_path, json.loads(job['csv_names'] or '{}'), config)
+            in_use.add(archive_path)
+            logger.info(f"Re-queued bulk import {job['id']} left by worker {job['owner_pid']}")
+        elif job['status'] == 'encoding':
+            _add_errors(db_path, job['id'], ['Encoding was interrupted; main.py encodes the remaining photos'])
+            _update(db_path, job['id'], 'done')
+        else:
+            _add_errors(db_path, job['id'], ['Import was interrupted by a worker restart; '
+                                             'upload the photos that are missing again'])
+            _update(db_path, job['id'], 'failed')
+            logger.warning(f"Bulk import {job['id']} was interrupted in state '{job['status']}'")
+
+    folder = config['BULK_UPLOAD_FOLDER']
+    for filename in os.listdir(folder) if os.path.isdir(folder) else []:
+        path = os.path.join(folder, filename)
+        if (path not in in_use and os.path.isfile(path)
+                and time.time() - os.path.getmtime(path) > STALE_ARCHIVE_SECONDS):
+            os.remove(path)
+            logger.info(f"Removed leftover bulk import archive {path}")
+
+def get_job(db_path: str, job_id: str) -> Optional[dict]:
+    """
+    Return the status of an import job.
+    """
+    conn = _connect(db_path)
+    try:
+        row = conn.execute(
+            'SELECT id, status, created_at, total, extracted, encoded, students_added, errors '
+            'FROM import_jobs WHERE id = ?', (job_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    job = dict(row)
+    job['errors'] = json.loads(job['errors'])
+    return job
+
+def _update(db_path: str, job_id: str, status: str, total: Optional[int] = None):
+    if total is None:
+        _execute(db_path, 'UPDATE import_jobs SET status = ? WHERE id = ?', (status, job_id))
+    else:
+        _execute(db_path, 'UPDATE import_jobs SET status = ?, total = ? WHERE id = ?', (status, total, job_id))
+
+def _increment(db_path: str, job_id: str, counter: str):
+    assert counter in JOB_COUNTERS
+    _execute(db_path, f'UPDATE import_jobs SET {counter} = {counter} + 1 WHERE id = ?', (job_id,))
+
+def _add_errors(db_path: str, job_id: str, messages: List[str]):
+    if not messages:
+        return
+    conn = _connect(db_path)
+    try:
+        with conn:
+            row = conn.execute('SELECT errors FROM import_jobs WHERE id = ?', (job_id,)).fetchone()
+            conn.execute('UPDATE import_jobs SET errors = ? WHERE id = ?',
+                         (json.dumps(json.loads(row['errors']) + messages), job_id))
+    finally:
+        conn.close()
+
+def _run():
+    while True:
+        job = _queue.get()
+        db_path = job['config']['ROSTER_DB']
+        try:
+            _process(job['id'], job['archive_path'], job['csv_names'], job['config'])
+        except Exception as e:
+            logger.error(f"Bulk import {job['id']} failed: {e}")
+            _add_errors(db_path, job['id'], [str(e)])
+            _update(db_path, job['id'], 'failed')
+        finally:
+            if os.path.exists(job['archive_path']):
+                os.remove(job['archive_path'])
+
+def _discard(target: str, image: str, config: dict):
+    """
+    Remove an extracted photo, its thumbnails and its directory once empty.
+    """
+    if os.path.exists(target):
+        os.remove(target)
+    if os.path.isdir(os.path.dirname(target)) and not os.listdir(os.path.dirname(target)):
+        os.rmdir(os.path.dirname(target))
+    thumbnails.remove_thumbnails(image, config['THUMBNAIL_FOLDER'])
+
+def _register_image(db_path: str, roll_no: str, name: str, image: str) -> bool:
+    """
+    Attach an extracted photo to the student with its roll number, or enroll
+    a new student. The roll number is checked again under the roster lock,
+    since web uploads or imports in other workers may have enrolled students
+    after plan_import() ran.
+
+    Returns:
+        True if a new student was added
+
+    Raises:
+        ValueError: If the roll number now belongs to a different student
+    """
+    with locked(db_path):
+        student = roster.find_by_roll_no(db_path, roll_no)
+        if student is None:
+            roster.add_student(db_path, name, roll_no, [image])
+            return True
+        if student['name'].lower() != name.lower():
+            raise ValueError(f"roll number {roll_no} is already registered to {student['name']}")
+        roster.add_image(db_path, student['id'], image)
+        return False
+
+def _process(job_id: str, archive_path: str, csv_names: Dict[str, str], config: dict):
+    db_path = config['ROSTER_DB']
+    _update(db_path, job_id, 'validating')
+    planned, errors = plan_import(archive_path, csv_names, db_path)
+    _add_errors(db_path, job_id, errors)
+    _update(db_path, job_id, 'extracting', total=len(planned))
+
+    imported = []
+    with zipfile.ZipFile(archive_path) as archive:
+        for item in planned:
+            image = roster.new_image_path(item['name'], item['roll_no'], os.path.splitext(item['entry'])[1])
+            target = os.path.join(config['UPLOAD_FOLDER'], image)
+            try:
+                with archive.open(item['entry']) as source, atomic_write(target, 'wb') as destination:
+                    _copy_limited(source, destination, MAX_IMAGE_SIZE)
+                thumbnails.generate_thumbnails(target, image, config['THUMBNAIL_FOLDER'])
+                if _register_image(db_path, item['roll_no'], item['name'], image):
+                    _increment(db_path, job_id, 'students_added')
+            except Exception as e:
+                _discard(target, image, config)
+                _add_errors(db_path, job_id, [f"{item['entry']}: {e}"])
+                continue
+
+            imported.append((image, target))
+            _increment(db_path, job_id, 'extracted')
+
+    if face_recognition is None:
+        _update(db_path, job_id, 'done')
+        logger.info(f"Bulk import {job_id}: {len(imported)} images imported, encoding deferred to main.py")
+        return
+
+    _update(db_path, job_id, 'encoding')
+    for image, target in imported:
+        try:
+            img = face_recognition.load_image_file(target)
+            encodings = face_recognition.face_encodings(img)
+            if encodings:
+                roster.set_image_encoding(db_path, image, encodings[0].tobytes())
+            else:
+                _add_errors(db_path, job_id, [f"{image}: no face detected"])
+        except Exception as e:
+            _add_errors(db_path, job_id, [f"{image}: {e}"])
+        _increment(db_path, job_id, 'encoded')
+
+    _update(db_path, job_id, 'done')
+    logger.info(f"Bulk import {job_id}: {len(imported)} images imported and encoded")
@@ -0,0 +1,217 @@
+import json
+import queue
+from collections import deque
+import sqlite3
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EVENTS_DB = 'attendance_events.db'
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    """
+    Open the event database, creating the events table if needed.
+    WAL mode lets the recognizer write while the web app reads.
+    """
+    conn = sqlite3.connect(db_path, timeout=5)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS events ('
+        'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+        'type TEXT NOT NULL, '
+        'payload TEXT NOT NULL, '
+        'created_at TEXT NOT NULL)'
+    )
+    return conn
+
+def publish_event(db_path: str, event_type: str, payload: dict):
+    """
+    Append an event to the change table.
+
+    Args:
+        db_path (str): Path to the SQLite event database
+        event_type (str): Event type, e.g. 'attendance_marked'
+        payload (dict): JSON-serialisable event data
+    """
+    try:
+        conn = _connect(db_path)
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT INTO events (type, payload, created_at) VALUES (?, ?, ?)',
+                    (event_type, json.dumps(payload), datetime.now().isoformat(timespec='seconds'))
+                )
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.error(f"Error publishing event: {e}")
+
+def read_events_since(db_path: str, last_id: int, limit: int = 500) -> List[dict]:
+    """
+    Read events newer than last_id, oldest first.
+
+    Args:
+        db_path (str): Path to the SQLite event database
+        last_id (int): Id of the last event already seen
+        limit (int): Maximum number of events to return
+
+    Returns:
+        List of events with 'id', 'type', 'created_at' and the payload fields
+    """
+    conn = _connect(db_path)
+    try:
+        rows = conn.execute(
+            'SELECT id, type, payload, created_at FROM events WHERE id > ? ORDER BY id LIMIT ?',
+            (last_id, limit)
+        ).fetchall()
+    finally:
+        conn.close()
+    return [
+        {'id': row[0], 'type': row[1], 'created_at': row[3], **json.loads(row[2])}
+        for row in rows
+    ]
+
+def latest_event_id(db_path: str) -> int:
+    """
+    Return the id of the newest event, or 0 when there are none.
+    """
+    conn = _connect(db_path)
+    try:
+        row = conn.execute('SELECT MAX(id) FROM events').fetchone()
+    finally:
+        conn.close()
+    return row[0] or 0
+
+class EventBroadcaster:
+    """
+    Fan out events from the change table to any number of subscribers.
+
+    A single background thread polls the database, so the disk load stays
+    the same no matter how many browsers are connected. Each subscriber
+    gets its own queue of events annotated with the running counters, and
+    recent events are kept in memory for browsers that poll instead.
+
+    The snapshot callable returns today's attendance count together with
+    the id of the last event that count already includes, read
+    consistently, so events are never counted twice.
+    """
+
+    def __init__(self, db_path: str, snapshot: Callable[[], Tuple[int, int]],
+                 poll_interval: float = 0.5, history: int = 500):
+        self.db_path = db_path
+        self.snapshot = snapshot
+        self.poll_interval = poll_interval
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._recent = deque(maxlen=history)
+        self._last_id = 0
+        self._counted_id = 0
+        self._date = None
+        self._today_attendees = 0
+
+    def counters(self) -> dict:
+        """
+        Current counters, as sent with every event.
+        """
+        with self._lock:
+            return {'date': self._date, 'today_attendees': self._today_attendees}
+
+    def start(self):
+        """
+        Start the polling thread if it is not running yet.
+        """
+        with self._lock:
+            if self._thread is None:
+                self._reset_counters()
+                self._last_id = self._counted_id
+                self._thread = threading.Thread(target=self._run, name='event-broadcaster', daemon=True)
+                self._thread.start()
+
+    def subscribe(self, max_subscribers: Optional[int] = None) -> Optional[queue.Queue]:
+        """
+        Register a new subscriber, starting the polling thread on first use.
+
+        Args:
+            max_subscribers (int, optional): Refuse new subscribers beyond this many
+
+        Returns:
+            The subscriber's event queue, or None when the limit is reached
+        """
+        self.start()
+        subscriber = queue.Queue(maxsize=100)
+        with self._lock:
+            if max_subscribers is not None and len(self._subscribers) >= max_subscribers:
+                return None
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: queue.Queue):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def is_subscribed(self, subscriber: queue.Queue) -> bool:
+        with self._lock:
+            return subscriber in self._subscribers
+
+    def recent_events(self, after: Optional[int]) -> Tuple[Optional[List[dict]], int, dict]:
+        """
+        Events newer than after, served from memory for polling browsers.
+
+        Args:
+            after (int, optional): Id of the last event the browser has seen;
+                None for just the current state
+
+        Returns:
+            Tuple of the events (None when memory no longer reaches back to
+            after, so the caller must read the database), the id of the
+            newest event, and the current counters
+        """
+        self.start()
+        with self._lock:
+            counters = {'date': self._date, 'today_attendees': self._today_attendees}
+            if after is None or after >= self._last_id:
+                return [], self._last_id, counters
+            if self._recent and self._recent[0]['id'] <= after + 1:
+                return [event for event in self._recent if event['id'] > after], self._last_id, counters
+            return None, self._last_id, counters
+
+    def _reset_counters(self):
+        self._date = datetime.now().strftime('%Y-%m-%d')
+        self._today_attendees, self._counted_id = self.snapshot()
+
+    def _run(self):
+        while True:
+            try:
+                self._poll()
+            except Exception as e:
+                logger.error(f"Error polling attendance events: {e}")
+            time.sleep(self.poll_interval)
+
+    def _poll(self):
+        events = read_events_since(self.db_path, self._last_id)
+        with self._lock:
+            if self._date != datetime.now().strftime('%Y-%m-%d'):
+                self._reset_counters()
+            if not events:
+                return
+
+            for event in events:
+                self._last_id = event['id']
+                # Events up to _counted_id are already in the snapshot count
+                if (event['type'] == 'attendance_marked' and event.get('date') == self._date
+                        and event['id'] > self._counted_id):
+                    self._today_attendees += 1
+                event['counters'] = {'date': self._date, 'today_attendees': self._today_attendees}
+                self._recent.append(event)
+
+                for subscriber in list(self._subscribers):
+                    try:
+                        subscriber.put_nowait(event)
+                    except queue.Full:
+                        # Drop slow clients; the browser reconnects with Last-Event-ID
+                        self._subscribers.discard(subscriber)
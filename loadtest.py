@@ -0,0 +1,362 @@
+"""
+Load test for running app.py under several WSGI workers.
+
+For each worker count, the app is started under gunicorn in a scratch
+directory. Client processes request the dashboard pages while writer
+processes mark attendance and update statistics, as several recognizers
+would. Mutator processes post uploads, edits, image replacements,
+deletions and bulk imports through the web workers, all fighting over a
+small set of contested roll numbers. The script reports requests/sec and
+checks the persisted files and roster afterwards for lost or torn writes,
+duplicate roll numbers, and images without files or files without images.
+
+    python loadtest.py --workers 1 2 4 --clients 16 --mutators 4 --duration 10
+
+Pass --no-locking to replace the cross-process file lock with a no-op in
+the server workers and writers; the checks should then report lost
+updates or roster damage, showing that the test can detect the races the
+lock prevents.
+
+Requires gunicorn (not available on Windows) and Pillow.
+"""
+import io
+import os
+import sys
+import uuid
+import csv
+import json
+import time
+import socket
+import random
+import shutil
+import sqlite3
+import zipfile
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from datetime import datetime
+
+REPO_PATH = os.path.dirname(os.path.abspath(__file__))
+PAGES = ['/', '/attendance', '/manage_students', '/upload_students']
+CONTESTED_NAMES = ['Alpha', 'Beta']
+BULK_WAIT_SECONDS = 120
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def _prepare_scratch(students: int) -> str:
+    """
+    Create a working directory with one generated photo per student.
+    """
+    from PIL import Image
+
+    scratch = tempfile.mkdtemp(prefix='attendance_loadtest_')
+    os.makedirs(os.path.join(scratch, 'Training_images'))
+    for roll_no in range(1, students + 1):
+        Image.new('RGB', (640, 480), (roll_no % 256, 80, 160)).save(
+            os.path.join(scratch, 'Training_images', f"{roll_no}_Student.jpg"))
+    return scratch
+
+@contextmanager
+def _no_lock(path: str, timeout: float = 0):
+    yield
+
+def _disable_locking():
+    """
+    Replace locked() with a no-op in every module that writes shared files.
+    """
+    import app
+    import attendance
+    import bulk_import
+    for module in (app, attendance, bulk_import):
+        module.locked = _no_lock
+
+def create_unlocked_app():
+    """
+    App factory used by the server under --no-locking. Startup maintenance
+    still runs locked, so only the writes under test race.
+    """
+    import app
+    flask_app = app.create_app()
+    _disable_locking()
+    return flask_app
+
+def _start_server(scratch: str, workers: int, threads: int, port: int, locking: bool) -> subprocess.Popen:
+    factory = 'app:create_app()' if locking else 'loadtest:create_unlocked_app()'
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn',
+         '--workers', str(workers), '--threads', str(threads),
+         '--bind', f'127.0.0.1:{port}', '--chdir', scratch, '--pythonpath', REPO_PATH,
+         '--log-level', 'warning', factory],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=2).read()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('Server did not start')
+
+def _client(port: int, duration: float) -> tuple:
+    """
+    Request pages round-robin until the duration elapses.
+
+    Returns:
+        Tuple of successful and failed request counts
+    """
+    ok = failed = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}{PAGES[ok % len(PAGES)]}', timeout=10) as response:
+                response.read()
+            ok += 1
+        except OSError:
+            failed += 1
+    return ok, failed
+
+def _photo() -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (320, 240), (random.randrange(256), 80, 160)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+def _post(port: int, path: str, fields: dict, files: dict):
+    """
+    POST a multipart form; files map a field to a (filename, bytes) pair.
+    """
+    boundary = uuid.uuid4().hex
+    body = io.BytesIO()
+    for key, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode())
+    for key, (filename, data) in files.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"; filename="{filename}"\r\n'
+                   f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+        body.write(data + b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode())
+    request = urllib.request.Request(f'http://127.0.0.1:{port}{path}', data=body.getvalue(),
+                                     headers={'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        response.read()
+
+def _contested_students(scratch: str, rolls: list) -> list:
+    conn = sqlite3.connect(os.path.join(scratch, 'roster.db'), timeout=5)
+    try:
+        return [row[0] for row in conn.execute(
+            f"SELECT id FROM students WHERE roll_no IN ({', '.join('?' * len(rolls))})", rolls)]
+    finally:
+        conn.close()
+
+def _mutator(scratch: str, port: int, rolls: list, duration: float, seed: int) -> tuple:
+    """
+    Post roster changes against the contested roll numbers until the
+    duration elapses. Rejections (a roll number already taken) are
+    expected; only failed requests count as errors.
+
+    Returns:
+        Tuple of successful and failed request counts
+    """
+    rng = random.Random(seed)
+    ok = failed = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        action = rng.choice(['upload', 'upload', 'edit', 'replace', 'delete', 'bulk'])
+        roll_no, name = str(rng.choice(rolls)), rng.choice(CONTESTED_NAMES)
+        try:
+            if action == 'upload':
+                _post(port, '/upload', {'name': name, 'rollno': roll_no}, {'file': ('photo.jpg', _photo())})
+            elif action == 'bulk':
+                archive = io.BytesIO()
+                with zipfile.ZipFile(archive, 'w') as zf:
+                    for bulk_roll_no in rng.sample(rolls, min(3, len(rolls))):
+                        zf.writestr(f"{bulk_roll_no}_{rng.choice(CONTESTED_NAMES)}.jpg", _photo())
+                _post(port, '/bulk_upload', {}, {'archive': ('photos.zip', archive.getvalue())})
+            else:
+                student_ids = _contested_students(scratch, rolls)
+                if not student_ids:
+                    continue
+                student_id = rng.choice(student_ids)
+                if action == 'edit':
+                    _post(port, '/edit_student', {'student_id': student_id, 'name': name, 'rollno': roll_no}, {})
+                elif action == 'replace':
+                    _post(port, '/update_student_image', {'student_id': student_id},
+                          {'file': ('photo.jpg', _photo())})
+                else:
+                    _post(port, '/delete_student', {'student_id': student_id}, {})
+            ok += 1
+        except OSError:
+            failed += 1
+    return ok, failed
+
+def _wait_for_imports(scratch: str):
+    """
+    Wait for queued bulk imports to finish, since stopping the server
+    mid-import would leave extracted files behind.
+    """
+    deadline = time.monotonic() + BULK_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        conn = sqlite3.connect(os.path.join(scratch, 'roster.db'), timeout=5)
+        try:
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM import_jobs WHERE status NOT IN ('done', 'failed')").fetchone()[0]
+        except sqlite3.OperationalError:
+            pending = 0
+        finally:
+            conn.close()
+        if not pending:
+            return
+        time.sleep(0.5)
+
+def _writer(scratch: str, student_ids: list, rounds: int, locking: bool):
+    """
+    Mark attendance and update statistics the way recognizer processes do.
+    Each round after the first only refreshes the time of existing rows.
+    """
+    os.chdir(scratch)
+    sys.path.insert(0, REPO_PATH)
+    if not locking:
+        _disable_locking()
+    from attendance import mark_attendance
+    import app
+
+    for _ in range(rounds):
+        for student_id in student_ids:
+            name = f"STUDENT {student_id}"
+            mark_attendance(student_id, name, str(student_id), app.ATTENDANCE_FILE, app.EVENTS_DB)
+            app.update_attendance_stats(name)
+
+def _verify(scratch: str, students: int, rounds: int) -> list:
+    """
+    Check the attendance CSV and statistics file for lost or torn writes.
+
+    Returns:
+        List of problems found; empty when every write landed
+    """
+    problems = []
+    today = datetime.now().strftime('%Y-%m-%d')
+
+    with open(os.path.join(scratch, 'Attendance.csv'), newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        rows = list(reader)
+    torn = [row for row in rows if None in row or None in row.values()]
+    if torn:
+        problems.append(f"{len(torn)} torn attendance rows")
+    marked = [row['StudentID'] for row in rows if row['Date'] == today]
+    if len(marked) != len(set(marked)):
+        problems.append(f"{len(marked) - len(set(marked))} duplicate attendance rows")
+    if len(set(marked)) != students:
+        problems.append(f"{students - len(set(marked))} attendance marks lost")
+
+    with open(os.path.join(scratch, 'attendance_stats.json')) as f:
+        stats = json.load(f)
+    updates = sum(entry['total_days'] for entry in stats.values())
+    if updates != students * rounds:
+        problems.append(f"{students * rounds - updates} statistics updates lost")
+
+    return problems
+
+def _verify_roster(scratch: str) -> list:
+    """
+    Check the roster against the training folder for duplicate roll
+    numbers, photos lost from students, and files registered to no one.
+
+    Returns:
+        List of problems found; empty when the roster is consistent
+    """
+    problems = []
+    training_path = os.path.join(scratch, 'Training_images')
+    conn = sqlite3.connect(os.path.join(scratch, 'roster.db'), timeout=5)
+    try:
+        duplicates = conn.execute(
+            'SELECT COUNT(*) FROM (SELECT roll_no FROM students GROUP BY roll_no HAVING COUNT(*) > 1)').fetchone()[0]
+        without_images = conn.execute(
+            'SELECT COUNT(*) FROM students WHERE id NOT IN (SELECT student_id FROM student_images)').fetchone()[0]
+        registered = {row[0] for row in conn.execute('SELECT path FROM student_images')}
+    finally:
+        conn.close()
+
+    on_disk = set()
+    for root, _, files in os.walk(training_path):
+        for filename in files:
+            if not filename.startswith('.'):
+                on_disk.add(os.path.relpath(os.path.join(root, filename), training_path).replace(os.sep, '/'))
+
+    if duplicates:
+        problems.append(f"{duplicates} roll numbers registered twice")
+    if without_images:
+        problems.append(f"{without_images} students without photos")
+    if registered - on_disk:
+        problems.append(f"{len(registered - on_disk)} registered images missing on disk")
+    if on_disk - registered:
+        problems.append(f"{len(on_disk - registered)} orphaned image files")
+    return problems
+
+def run(worker_counts: list, clients: int, writers: int, students: int,
+        rounds: int, duration: float, threads: int, mutators: int = 4,
+        contested: int = 10, locking: bool = True):
+    print(f"{'Workers':>8}{'Req/s':>10}{'Posts':>8}{'Errors':>8}  Checks")
+    rolls = list(range(students + 1, students + contested + 1))
+    for workers in worker_counts:
+        scratch = _prepare_scratch(students)
+        port = _free_port()
+        server = _start_server(scratch, workers, threads, port, locking)
+        try:
+            slices = [list(range(1 + i, students + 1, writers)) for i in range(writers)]
+            writer_processes = [
+                multiprocessing.Process(target=_writer, args=(scratch, ids, rounds, locking)) for ids in slices
+            ]
+            for process in writer_processes:
+                process.start()
+
+            start = time.monotonic()
+            with multiprocessing.Pool(clients + mutators) as pool:
+                readers = pool.starmap_async(_client, [(port, duration)] * clients)
+                posters = pool.starmap_async(_mutator, [(scratch, port, rolls, duration, seed)
+                                                        for seed in range(mutators)])
+                results, post_results = readers.get(), posters.get()
+            elapsed = time.monotonic() - start
+
+            for process in writer_processes:
+                process.join()
+            _wait_for_imports(scratch)
+        finally:
+            server.terminate()
+            server.wait()
+
+        ok = sum(result[0] for result in results)
+        posts = sum(result[0] for result in post_results)
+        failed = sum(result[1] for result in results + post_results)
+        problems = _verify(scratch, students, rounds) + _verify_roster(scratch)
+        print(f"{workers:>8}{ok / elapsed:>10.1f}{posts:>8}{failed:>8}  {'; '.join(problems) or 'OK'}")
+        shutil.rmtree(scratch, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-worker load test for the attendance web app')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='Worker counts to test')
+    parser.add_argument('--threads', type=int, default=4, help='Threads per worker')
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent HTTP client processes')
+    parser.add_argument('--writers', type=int, default=4, help='Concurrent attendance writer processes')
+    parser.add_argument('--mutators', type=int, default=4, help='Concurrent upload/edit/delete client processes')
+    parser.add_argument('--contested', type=int, default=10, help='Roll numbers the mutators compete for')
+    parser.add_argument('--students', type=int, default=200, help='Students to enroll and mark')
+    parser.add_argument('--rounds', type=int, default=3, help='Times each student is marked')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds of HTTP load per run')
+    parser.add_argument('--no-locking', dest='locking', action='store_false',
+                        help='Disable the file lock to check that lost writes are detected')
+    args = parser.parse_args()
+
+    run(args.workers, args.clients, args.writers, args.students, args.rounds, args.duration, args.threads,
+        args.mutators, args.contested, args.locking)
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,17 @@
 import cv2
+import csv
 import numpy as np
 import face_recognition
 import os
-import pandas as pd
 import logging
 import argparse
-from datetime import datetime
-from typing import List, Tuple
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from attendance import mark_attendance
+from events import EVENTS_DB
+from roster import ROSTER_DB, get_image_encodings, list_students, set_image_encoding, sync_training_images
+from storage import locked
 
 # Configure logging
 logging.basicConfig(
@@ -23,137 +28,415 @@ logger = logging.getLogger(__name__)
 CONFIG = {
     'TRAINING_IMAGES_PATH': 'Training_images',
     'ATTENDANCE_FILE': 'Attendance.csv',
+    'ROSTER_DB': ROSTER_DB,  # Student registry keyed by immutable student id
+    'EVENTS_DB': EVENTS_DB,  # SQLite change table the dashboard streams from
     'CONFIDENCE_THRESHOLD': 0.5,  # Lower means more strict face matching
+    'CENTROID_TOP_K': 3,  # Students whose full gallery is compared after the centroid prefilter
     'RESIZE_SCALE': 0.25,
     'WEBCAM_INDEX': 0,
+    'DETECTOR_BACKEND': 'hog',  # One of: hog, haar, dnn, cascade
+    'HAAR_CASCADE_FILE': os.path.join(cv2.data.haarcascades, 'haarcascade_frontalface_default.xml'),
+    'HAAR_MIN_FACE_SIZE': 20,  # Pixels, measured on the resized frame
+    'DNN_PROTOTXT': os.path.join('models', 'deploy.prototxt'),
+    'DNN_MODEL': os.path.join('models', 'res10_300x300_ssd_iter_140000.caffemodel'),
+    'DNN_CONFIDENCE': 0.5,
+    'CASCADE_MARGIN': 0.25,  # Fraction of the candidate box added on each side before HOG confirmation
+    'BENCHMARK_PATH': os.path.join('benchmarks', 'faces'),  # Fixture images for --benchmark
+    'BENCHMARK_MIN_IOU': 0.5,  # Overlap with the reference box needed to count a detection as a hit
 }
 
-def load_training_images(path: str) -> Tuple[List[np.ndarray], List[str], List[str]]:
+# A face location in face_recognition order: (top, right, bottom, left)
+FaceLocation = Tuple[int, int, int, int]
+FaceDetector = Callable[[np.ndarray], List[FaceLocation]]
+
+def load_training_images(path: str, roster_db: str) -> Tuple[
+    List[Optional[np.ndarray]], List[str], List[int], List[str], List[str]
+]:
     """
-    Load training images and extract names and roll numbers.
+    Load training images registered in the student roster.
+    
+    The roster is first synced with the training folder, so photos dropped
+    in as 'Roll_Name.ext' files or 'Roll_Name/' directories are picked up.
+    Each loaded photo gets its own entry, so students may repeat. Photos
+    whose encoding is already cached in the roster are not read from disk;
+    their image entry is None.
     
     Args:
         path (str): Directory containing training images
+        roster_db (str): Path to the student roster database
     
     Returns:
-        Tuple of images, names, and roll numbers
+        Tuple of images, image paths, student ids, names, and roll numbers
     """
     images = []
+    image_paths = []
+    student_ids = []
     class_names = []
     roll_numbers = []
     
     try:
-        image_files = os.listdir(path)
-        logger.info(f"Found {len(image_files)} training images")
+        with locked(roster_db):
+            sync_training_images(roster_db, path)
+        students = list_students(roster_db)
+        cached = get_image_encodings(roster_db)
+        logger.info(f"Found {len(students)} students in the roster")
         
-        for filename in image_files:
-            img_path = os.path.join(path, filename)
-            try:
-                cur_img = cv2.imread(img_path)
-                if cur_img is not None:
-                    # Split filename to extract roll number and name
-                    name_parts = os.path.splitext(filename)[0].split('_')
-                    
-                    # Check if first part is a roll number (digits)
-                    if name_parts[0].isdigit():
-                        roll_no = name_parts[0]
-                        name = ' '.join(name_parts[1:]).title()
+        for student in students:
+            for image in student['images']:
+                img_path = os.path.join(path, image)
+                try:
+                    cur_img = None if image in cached else cv2.imread(img_path)
+                    if cur_img is not None or image in cached:
+                        images.append(cur_img)
+                        image_paths.append(image)
+                        student_ids.append(student['id'])
+                        class_names.append(student['name'])
+                        roll_numbers.append(student['roll_no'])
                     else:
-                        roll_no = 'N/A'
-                        name = ' '.join(name_parts).title()
-                    
-                    images.append(cur_img)
-                    class_names.append(name)
-                    roll_numbers.append(roll_no)
-                else:
-                    logger.warning(f"Could not load image: {img_path}")
-            except Exception as e:
-                logger.error(f"Error loading {filename}: {e}")
+                        logger.warning(f"Could not load image: {img_path}")
+                except Exception as e:
+                    logger.error(f"Error loading {img_path}: {e}")
         
-        return images, class_names, roll_numbers
+        return images, image_paths, student_ids, class_names, roll_numbers
     
     except Exception as e:
         logger.critical(f"Failed to load training images: {e}")
-        return [], [], []
+        return [], [], [], [], []
 
-def find_encodings(images: List[np.ndarray]) -> List[np.ndarray]:
+def encode_face(img: np.ndarray) -> Optional[np.ndarray]:
     """
-    Encode known faces.
+    Encode the first face found in a BGR image.
     
     Args:
-        images (List[np.ndarray]): List of training images
+        img (np.ndarray): Training image
     
     Returns:
-        List of face encodings
+        The face encoding, or None if no face could be encoded
     """
-    encode_list = []
-    for img in images:
-        try:
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-            encodings = face_recognition.face_encodings(img_rgb)
-            
-            if encodings:
-                encode_list.append(encodings[0])
-            else:
-                logger.warning("No face detected in an image")
-        except Exception as e:
-            logger.error(f"Error encoding image: {e}")
+    try:
+        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        encodings = face_recognition.face_encodings(img_rgb)
+        
+        if encodings:
+            return encodings[0]
+        logger.warning("No face detected in an image")
+    except Exception as e:
+        logger.error(f"Error encoding image: {e}")
+    return None
+
+def build_gallery(
+    images: List[Optional[np.ndarray]],
+    image_paths: List[str],
+    student_ids: List[int],
+    names: List[str],
+    roll_nos: List[str],
+    roster_db: str
+) -> dict:
+    """
+    Encode every training photo and group the encodings per student.
     
-    return encode_list
+    Encodings cached in the roster are reused; new ones are written back,
+    so only photos added since the last run are encoded.
+    
+    Args:
+        images (List[Optional[np.ndarray]]): Training images, None when cached
+        image_paths (List[str]): Roster image path for each image
+        student_ids (List[int]): Roster id for each image
+        names (List[str]): Student name for each image
+        roll_nos (List[str]): Roll number for each image
+        roster_db (str): Path to the student roster database
+    
+    Returns:
+        Dictionary with per-student 'ids', 'names', 'roll_nos', 'encodings'
+        (an array of all encodings of that student) and 'centroids'
+        (one mean encoding per student, stacked into a single array)
+    """
+    cached = get_image_encodings(roster_db)
+    grouped = {}
+    for img, image_path, student_id, name, roll_no in zip(images, image_paths, student_ids, names, roll_nos):
+        if image_path in cached:
+            encoding = np.frombuffer(cached[image_path], dtype=np.float64)
+        else:
+            encoding = encode_face(img)
+            if encoding is not None:
+                set_image_encoding(roster_db, image_path, encoding.astype(np.float64).tobytes())
+        if encoding is not None:
+            grouped.setdefault((student_id, name, roll_no), []).append(encoding)
 
-def mark_attendance(name: str, roll_no: str, attendance_file: str):
+    gallery = {'ids': [], 'names': [], 'roll_nos': [], 'encodings': [], 'centroids': np.empty((0, 128))}
+    for (student_id, name, roll_no), encodings in grouped.items():
+        gallery['ids'].append(student_id)
+        gallery['names'].append(name)
+        gallery['roll_nos'].append(roll_no)
+        gallery['encodings'].append(np.array(encodings))
+
+    if gallery['encodings']:
+        gallery['centroids'] = np.array([encodings.mean(axis=0) for encodings in gallery['encodings']])
+
+    logger.info(f"Built gallery of {len(gallery['names'])} students from "
+                f"{sum(len(e) for e in gallery['encodings'])} encodings")
+    return gallery
+
+def match_face(face_encoding: np.ndarray, gallery: dict, config: dict) -> Optional[int]:
     """
-    Mark or update attendance for a recognized person.
+    Find the student matching a face encoding.
+    
+    Distances to the per-student centroids pick the CENTROID_TOP_K closest
+    students; only their full galleries are then compared, so the cost per
+    face grows with the number of students rather than the number of photos.
     
     Args:
-        name (str): Name of the recognized person
-        roll_no (str): Roll number of the recognized person
-        attendance_file (str): Path to attendance CSV file
+        face_encoding (np.ndarray): Encoding of the face to identify
+        gallery (dict): Gallery built by build_gallery()
+        config (dict): Configuration dictionary
+    
+    Returns:
+        Index of the matching student in the gallery, or None
     """
-    try:
-        # Check if CSV exists, if not create with new columns
+    if not gallery['names']:
+        return None
+
+    centroid_distances = face_recognition.face_distance(gallery['centroids'], face_encoding)
+    top_k = min(config['CENTROID_TOP_K'], len(centroid_distances))
+    candidates = np.argpartition(centroid_distances, top_k - 1)[:top_k]
+
+    best_index, best_distance = None, float('inf')
+    for index in candidates:
+        distance = face_recognition.face_distance(gallery['encodings'][index], face_encoding).min()
+        if distance < best_distance:
+            best_index, best_distance = int(index), distance
+
+    if best_distance <= config['CONFIDENCE_THRESHOLD']:
+        return best_index
+    return None
+
+def _hog_detector(config: dict) -> FaceDetector:
+    """
+    Build the default dlib HOG detector used by face_recognition.
+    """
+    def detect(rgb_frame: np.ndarray) -> List[FaceLocation]:
+        return face_recognition.face_locations(rgb_frame, model='hog')
+
+    return detect
+
+def _haar_detector(config: dict) -> FaceDetector:
+    """
+    Build an OpenCV Haar cascade detector using the cascade bundled with OpenCV.
+    """
+    classifier = cv2.CascadeClassifier(config['HAAR_CASCADE_FILE'])
+    if classifier.empty():
+        raise ValueError(f"Could not load Haar cascade: {config['HAAR_CASCADE_FILE']}")
+    min_size = (config['HAAR_MIN_FACE_SIZE'], config['HAAR_MIN_FACE_SIZE'])
+
+    def detect(rgb_frame: np.ndarray) -> List[FaceLocation]:
+        gray = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2GRAY)
+        gray = cv2.equalizeHist(gray)
+        boxes = classifier.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=min_size)
+        return [(int(y), int(x + w), int(y + h), int(x)) for (x, y, w, h) in boxes]
+
+    return detect
+
+def _dnn_detector(config: dict) -> FaceDetector:
+    """
+    Build an OpenCV DNN detector from the ResNet-10 SSD Caffe face model.
+    The model files are not bundled with OpenCV; place them at the
+    DNN_PROTOTXT and DNN_MODEL paths from the configuration.
+    """
+    for model_path in (config['DNN_PROTOTXT'], config['DNN_MODEL']):
+        if not os.path.exists(model_path):
+            raise ValueError(f"DNN face model file not found: {model_path}")
+    net = cv2.dnn.readNetFromCaffe(config['DNN_PROTOTXT'], config['DNN_MODEL'])
+
+    def detect(rgb_frame: np.ndarray) -> List[FaceLocation]:
+        height, width = rgb_frame.shape[:2]
+        bgr_frame = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2BGR)
+        blob = cv2.dnn.blobFromImage(cv2.resize(bgr_frame, (300, 300)), 1.0,
+                                     (300, 300), (104.0, 177.0, 123.0))
+        net.setInput(blob)
+        detections = net.forward()
+
+        locations = []
+        for i in range(detections.shape[2]):
+            if detections[0, 0, i, 2] < config['DNN_CONFIDENCE']:
+                continue
+            left, top, right, bottom = (detections[0, 0, i, 3:7] * [width, height, width, height]).astype(int)
+            top, left = max(0, top), max(0, left)
+            bottom, right = min(height, bottom), min(width, right)
+            if bottom > top and right > left:
+                locations.append((int(top), int(right), int(bottom), int(left)))
+        return locations
+
+    return detect
+
+def _cascade_detector(config: dict) -> FaceDetector:
+    """
+    Build a two-stage detector: the fast Haar cascade proposes candidates and
+    HOG confirms each one on a small crop instead of scanning the whole frame.
+    """
+    propose = _haar_detector(config)
+    margin = config['CASCADE_MARGIN']
+
+    def detect(rgb_frame: np.ndarray) -> List[FaceLocation]:
+        height, width = rgb_frame.shape[:2]
+        locations = []
+        for top, right, bottom, left in propose(rgb_frame):
+            pad_y = int((bottom - top) * margin)
+            pad_x = int((right - left) * margin)
+            crop_top, crop_left = max(0, top - pad_y), max(0, left - pad_x)
+            crop_bottom, crop_right = min(height, bottom + pad_y), min(width, right + pad_x)
+            crop = np.ascontiguousarray(rgb_frame[crop_top:crop_bottom, crop_left:crop_right])
+
+            confirmed = face_recognition.face_locations(crop, model='hog')
+            if confirmed:
+                # Keep the largest confirmation and map it back to frame coordinates
+                c_top, c_right, c_bottom, c_left = max(
+                    confirmed, key=lambda loc: (loc[2] - loc[0]) * (loc[1] - loc[3]))
+                locations.append((c_top + crop_top, c_right + crop_left,
+                                  c_bottom + crop_top, c_left + crop_left))
+        return locations
+
+    return detect
+
+DETECTOR_BACKENDS: Dict[str, Callable[[dict], FaceDetector]] = {
+    'hog': _hog_detector,
+    'haar': _haar_detector,
+    'dnn': _dnn_detector,
+    'cascade': _cascade_detector,
+}
+
+def get_face_detector(config: dict) -> FaceDetector:
+    """
+    Create the face detector selected by config['DETECTOR_BACKEND'].
+    
+    Args:
+        config (dict): Configuration dictionary
+    
+    Returns:
+        A callable taking an RGB frame and returning (top, right, bottom, left) boxes
+    """
+    backend = config.get('DETECTOR_BACKEND', 'hog')
+    if backend not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown detector backend '{backend}'. "
+                         f"Choose from: {', '.join(DETECTOR_BACKENDS)}")
+    logger.info(f"Using '{backend}' face detector")
+    return DETECTOR_BACKENDS[backend](config)
+
+def load_reference_boxes(fixtures_path: str) -> Dict[str, FaceLocation]:
+    """
+    Read optional reference face boxes from 'boxes.csv' in the fixture folder.
+    
+    Each row holds 'image,top,right,bottom,left', with the image path relative
+    to the fixture folder and the box in original image pixels.
+    
+    Args:
+        fixtures_path (str): Directory containing fixture images
+    
+    Returns:
+        Dictionary of reference boxes keyed by relative image path
+    """
+    boxes = {}
+    boxes_file = os.path.join(fixtures_path, 'boxes.csv')
+    if not os.path.exists(boxes_file):
+        return boxes
+    
+    with open(boxes_file, newline='') as f:
+        for row in csv.DictReader(f):
+            try:
+                boxes[row['image'].strip()] = tuple(int(row[key]) for key in ('top', 'right', 'bottom', 'left'))
+            except (KeyError, TypeError, ValueError):
+                logger.warning(f"Skipping invalid reference box row: {row}")
+    return boxes
+
+def box_overlap(a: FaceLocation, b: FaceLocation) -> float:
+    """
+    Intersection over union of two (top, right, bottom, left) boxes.
+    """
+    height = min(a[2], b[2]) - max(a[0], b[0])
+    width = min(a[1], b[1]) - max(a[3], b[3])
+    if height <= 0 or width <= 0:
+        return 0.0
+    intersection = height * width
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return intersection / (area_a + area_b - intersection)
+
+def benchmark_detectors(config: dict, fixtures_path: str):
+    """
+    Compare detector backends for speed and recall on fixture images.
+    
+    Fixture images are read recursively, so 'Roll_Name/' gallery folders
+    are included. Each image is expected to contain exactly one face. An
+    image counts as a hit when a detection overlaps its reference box from
+    'boxes.csv' (IoU >= BENCHMARK_MIN_IOU), or, without a reference box,
+    when exactly one face is detected. Detections beyond the hit are
+    reported as false positives. See benchmarks/README.md for the layout.
+    
+    Args:
+        config (dict): Configuration dictionary
+        fixtures_path (str): Directory containing fixture images
+    """
+    scale = config['RESIZE_SCALE']
+    reference_boxes = load_reference_boxes(fixtures_path)
+    frames = []
+    for root, dirs, files in os.walk(fixtures_path):
+        dirs.sort()
+        for filename in sorted(files):
+            img = cv2.imread(os.path.join(root, filename))
+            if img is None:
+                continue
+            image = os.path.relpath(os.path.join(root, filename), fixtures_path).replace(os.sep, '/')
+            small = cv2.resize(img, (0, 0), None, scale, scale)
+            box = reference_boxes.get(image)
+            if box is not None:
+                box = tuple(int(value * scale) for value in box)
+            frames.append((cv2.cvtColor(small, cv2.COLOR_BGR2RGB), box))
+
+    if not frames:
+        logger.critical(f"No fixture images found in {fixtures_path} (see benchmarks/README.md)")
+        return
+
+    print(f"Benchmarking on {len(frames)} images ({sum(box is not None for _, box in frames)} "
+          f"with reference boxes) at scale {scale}")
+    print(f"{'Backend':<10}{'FPS':>10}{'Recall':>10}{'False pos':>11}")
+    for backend in DETECTOR_BACKENDS:
         try:
-            df = pd.read_csv(attendance_file)
-        except FileNotFoundError:
-            df = pd.DataFrame(columns=["Name", "RollNo", "Date", "Time"])
+            detect = get_face_detector({**config, 'DETECTOR_BACKEND': backend})
+        except ValueError as e:
+            print(f"{backend:<10}{'skipped':>10}  ({e})")
+            continue
 
-        now = datetime.now()
-        date_string = now.strftime('%Y-%m-%d')
-        time_string = now.strftime('%H:%M:%S')
+        detections = []
+        start = time.perf_counter()
+        for frame, _ in frames:
+            detections.append(detect(frame))
+        elapsed = time.perf_counter() - start
 
-        # Check for existing entry on the same day
-        mask = (df["Name"] == name) & (df["Date"] == date_string)
-        
-        if mask.any():
-            # Update time if already present
-            df.loc[mask, "Time"] = time_string
-            logger.info(f"Updated attendance for {name} (Roll No: {roll_no})")
-        else:
-            # Add new entry
-            new_entry = pd.DataFrame([[name, roll_no, date_string, time_string]], 
-                                     columns=["Name", "RollNo", "Date", "Time"])
-            df = pd.concat([df, new_entry], ignore_index=True)
-            logger.info(f"Marked attendance for {name} (Roll No: {roll_no})")
+        hits = false_positives = 0
+        for (_, box), locations in zip(frames, detections):
+            if box is not None:
+                hit = any(box_overlap(box, location) >= config['BENCHMARK_MIN_IOU'] for location in locations)
+            else:
+                hit = len(locations) == 1
+            hits += hit
+            false_positives += len(locations) - 1 if hit else len(locations)
 
-        df.to_csv(attendance_file, index=False)
-    except Exception as e:
-        logger.error(f"Error marking attendance: {e}")
+        fps = len(frames) / elapsed if elapsed > 0 else float('inf')
+        print(f"{backend:<10}{fps:>10.1f}{hits / len(frames):>10.2%}{false_positives:>11}")
 
-def recognize_faces(
-    config: dict, 
-    known_encodings: List[np.ndarray], 
-    known_names: List[str],
-    known_roll_nos: List[str]
-):
+def recognize_faces(config: dict, gallery: dict):
     """
     Main face recognition and attendance marking function.
     
     Args:
         config (dict): Configuration dictionary
-        known_encodings (List[np.ndarray]): Pre-computed face encodings
-        known_names (List[str]): Names corresponding to encodings
-        known_roll_nos (List[str]): Roll numbers corresponding to encodings
+        gallery (dict): Known students and their encodings, from build_gallery()
     """
+    try:
+        detect_faces = get_face_detector(config)
+    except ValueError as e:
+        logger.critical(f"Cannot create face detector: {e}")
+        return
+
     cap = cv2.VideoCapture(config['WEBCAM_INDEX'])
     
     if not cap.isOpened():
@@ -175,7 +458,7 @@ def recognize_faces(
             small_frame_rgb = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
 
             # Find faces in current frame
-            face_locations = face_recognition.face_locations(small_frame_rgb)
+            face_locations = detect_faces(small_frame_rgb)
             face_encodings = face_recognition.face_encodings(small_frame_rgb, face_locations)
 
             for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
@@ -186,21 +469,16 @@ def recognize_faces(
                 left = int(left / config['RESIZE_SCALE'])
 
                 # Compare face with known faces
-                matches = face_recognition.compare_faces(
-                    known_encodings, 
-                    face_encoding, 
-                    tolerance=config['CONFIDENCE_THRESHOLD']
-                )
                 name = "Unknown"
                 roll_no = "N/A"
 
-                face_distances = face_recognition.face_distance(known_encodings, face_encoding)
-                best_match_index = np.argmin(face_distances)
+                best_match_index = match_face(face_encoding, gallery, config)
 
-                if matches[best_match_index]:
-                    name = known_names[best_match_index].upper()
-                    roll_no = known_roll_nos[best_match_index]
-                    mark_attendance(name, roll_no, config['ATTENDANCE_FILE'])
+                if best_match_index is not None:
+                    name = gallery['names'][best_match_index].upper()
+                    roll_no = gallery['roll_nos'][best_match_index]
+                    mark_attendance(gallery['ids'][best_match_index], name, roll_no,
+                                    config['ATTENDANCE_FILE'], config['EVENTS_DB'])
 
                 # Draw rectangle and name
                 cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
@@ -227,24 +505,37 @@ def main():
     """
     parser = argparse.ArgumentParser(description='Face Recognition Attendance System')
     parser.add_argument('--train', action='store_true', help='Train the face recognition model')
+    parser.add_argument('--detector', choices=sorted(DETECTOR_BACKENDS),
+                        help='Face detector backend (overrides CONFIG)')
+    parser.add_argument('--benchmark', nargs='?', const=CONFIG['BENCHMARK_PATH'], metavar='DIR',
+                        help='Benchmark detector backends on fixture images and exit')
     args = parser.parse_args()
 
+    if args.detector:
+        CONFIG['DETECTOR_BACKEND'] = args.detector
+
+    if args.benchmark:
+        benchmark_detectors(CONFIG, args.benchmark)
+        return
+
     # Load training images
-    training_images, class_names, roll_numbers = load_training_images(CONFIG['TRAINING_IMAGES_PATH'])
+    training_images, image_paths, student_ids, class_names, roll_numbers = load_training_images(
+        CONFIG['TRAINING_IMAGES_PATH'], CONFIG['ROSTER_DB'])
     
     if not training_images:
         logger.critical("No training images found. Please upload student images.")
         return
 
-    # Compute face encodings
-    known_encodings = find_encodings(training_images)
+    # Compute face encodings grouped per student
+    gallery = build_gallery(training_images, image_paths, student_ids, class_names, roll_numbers,
+                            CONFIG['ROSTER_DB'])
 
     if args.train:
         logger.info("Training completed. Encodings generated.")
         return
 
     # Start face recognition
-    recognize_faces(CONFIG, known_encodings, class_names, roll_numbers)
+    recognize_faces(CONFIG, gallery)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,356 @@
+import os
+import re
+import uuid
+import sqlite3
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ROSTER_DB = 'roster.db'
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff'}
+NAME_PATTERN = re.compile(r'^[A-Za-z\s]+$')
+ROLL_NO_PATTERN = re.compile(r'^[0-9]+$')
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    """
+    Open the roster database, creating the tables if needed.
+
+    Students are keyed by an immutable integer id; name and roll number are
+    plain attributes, and image paths (relative to the training folder)
+    point back at their student, optionally with a cached face encoding.
+    """
+    conn = sqlite3.connect(db_path, timeout=5)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA foreign_keys=ON')
+    conn.executescript(
+        'CREATE TABLE IF NOT EXISTS students ('
+        'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+        'name TEXT NOT NULL, '
+        'roll_no TEXT NOT NULL, '
+        'created_at TEXT NOT NULL);'
+        'CREATE INDEX IF NOT EXISTS idx_students_roll_no ON students (roll_no);'
+        'CREATE TABLE IF NOT EXISTS student_images ('
+        'path TEXT PRIMARY KEY, '
+        'student_id INTEGER NOT NULL REFERENCES students (id) ON DELETE CASCADE, '
+        'encoding BLOB);'
+        'CREATE INDEX IF NOT EXISTS idx_student_images_student ON student_images (student_id);'
+    )
+    columns = {row['name'] for row in conn.execute('PRAGMA table_info(student_images)')}
+    if 'encoding' not in columns:
+        conn.execute('ALTER TABLE student_images ADD COLUMN encoding BLOB')
+    return conn
+
+def parse_student_name(stem: str) -> Tuple[str, str]:
+    """
+    Split a 'Roll_Name' file or directory stem into a name and roll number.
+
+    Args:
+        stem (str): Filename without extension, or directory name
+
+    Returns:
+        Tuple of name and roll number ('N/A' when no roll number is present)
+    """
+    name_parts = stem.split('_')
+
+    # Check if first part is a roll number (digits)
+    if name_parts[0].isdigit():
+        return ' '.join(name_parts[1:]).title(), name_parts[0]
+    return ' '.join(name_parts).title(), 'N/A'
+
+def new_image_path(name: str, roll_no: str, ext: str) -> str:
+    """
+    Choose a path, relative to the training folder, for a new student photo.
+
+    Photos go in a 'Roll_Name/' directory, which sync_training_images()
+    understands, under a random filename. A new photo therefore never
+    replaces an existing one, even after a rename frees the roll number.
+
+    Args:
+        name (str): Student name
+        roll_no (str): Student roll number
+        ext (str): File extension including the dot
+
+    Returns:
+        The new image path
+
+    Raises:
+        ValueError: If the name, roll number or extension could escape the directory
+    """
+    if not NAME_PATTERN.match(name) or not ROLL_NO_PATTERN.match(roll_no):
+        raise ValueError(f"Invalid student name '{name}' or roll number '{roll_no}'")
+    if ext and ext.lower() not in IMAGE_EXTENSIONS:
+        raise ValueError(f"Invalid image extension '{ext}'")
+    return f"{roll_no}_{'_'.join(name.split())}/{uuid.uuid4().hex}{ext.lower()}"
+
+def _student_from_rows(student: sqlite3.Row, images: List[str]) -> dict:
+    return {
+        'id': student['id'],
+        'name': student['name'],
+        'roll_no': student['roll_no'],
+        'images': images,
+        'image': images[0] if images else None,
+    }
+
+def add_student(db_path: str, name: str, roll_no: str, image_paths: Iterable[str] = ()) -> int:
+    """
+    Register a new student.
+
+    Args:
+        db_path (str): Path to the roster database
+        name (str): Student name
+        roll_no (str): Student roll number
+        image_paths (Iterable[str]): Image paths relative to the training folder
+
+    Returns:
+        The new student's id
+
+    Raises:
+        sqlite3.IntegrityError: If an image path already belongs to a student
+    """
+    conn = _connect(db_path)
+    try:
+        with conn:
+            cursor = conn.execute(
+                'INSERT INTO students (name, roll_no, created_at) VALUES (?, ?, ?)',
+                (name, roll_no, datetime.now().isoformat(timespec='seconds'))
+            )
+            student_id = cursor.lastrowid
+            conn.executemany(
+                'INSERT INTO student_images (path, student_id) VALUES (?, ?)',
+                [(path, student_id) for path in image_paths]
+            )
+    finally:
+        conn.close()
+    return student_id
+
+def update_student(db_path: str, student_id: int, name: str, roll_no: str):
+    """
+    Change a student's name and roll number. Attendance references the id,
+    so nothing else needs rewriting.
+    """
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute('UPDATE students SET name = ?, roll_no = ? WHERE id = ?',
+                         (name, roll_no, student_id))
+    finally:
+        conn.close()
+
+def delete_student(db_path: str, student_id: int):
+    """
+    Remove a student and their image references.
+    """
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute('DELETE FROM students WHERE id = ?', (student_id,))
+    finally:
+        conn.close()
+
+def add_image(db_path: str, student_id: int, path: str):
+    """
+    Attach an image path to a student. Raises sqlite3.IntegrityError if the
+    path already belongs to a student, rather than moving it.
+    """
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute('INSERT INTO student_images (path, student_id) VALUES (?, ?)',
+                         (path, student_id))
+    finally:
+        conn.close()
+
+def remove_image(db_path: str, path: str) -> Optional[int]:
+    """
+    Detach an image path. A student left without images is removed as well,
+    matching the one-image-per-student behaviour of the upload pages.
+
+    Returns:
+        The id of the student the image belonged to, or None
+    """
+    conn = _connect(db_path)
+    try:
+        with conn:
+            row = conn.execute('SELECT student_id FROM student_images WHERE path = ?', (path,)).fetchone()
+            if row is None:
+                return None
+            conn.execute('DELETE FROM student_images WHERE path = ?', (path,))
+            conn.execute(
+                'DELETE FROM students WHERE id = ? AND NOT EXISTS '
+                '(SELECT 1 FROM student_images WHERE student_id = ?)',
+                (row['student_id'], row['student_id'])
+            )
+            return row['student_id']
+    finally:
+        conn.close()
+
+def set_image_encoding(db_path: str, path: str, encoding: Optional[bytes]):
+    """
+    Cache the face encoding computed for an image.
+    """
+    conn = _connect(db_path)
+    try:
+        with conn:
+            conn.execute('UPDATE student_images SET encoding = ? WHERE path = ?', (encoding, path))
+    finally:
+        conn.close()
+
+def get_image_encodings(db_path: str) -> Dict[str, bytes]:
+    """
+    Return cached face encodings keyed by image path.
+    """
+    conn = _connect(db_path)
+    try:
+        return {row['path']: row['encoding'] for row in conn.execute(
+            'SELECT path, encoding FROM student_images WHERE encoding IS NOT NULL')}
+    finally:
+        conn.close()
+
+def get_student(db_path: str, student_id: int) -> Optional[dict]:
+    """
+    Look up a student by id.
+    """
+    conn = _connect(db_path)
+    try:
+        student = conn.execute('SELECT * FROM students WHERE id = ?', (student_id,)).fetchone()
+        if student is None:
+            return None
+        images = [row['path'] for row in conn.execute(
+            'SELECT path FROM student_images WHERE student_id = ? ORDER BY path', (student_id,))]
+    finally:
+        conn.close()
+    return _student_from_rows(student, images)
+
+def find_by_roll_no(db_path: str, roll_no: str) -> Optional[dict]:
+    """
+    Look up a student by roll number.
+    """
+    conn = _connect(db_path)
+    try:
+        row = conn.execute('SELECT id FROM students WHERE roll_no = ?', (roll_no,)).fetchone()
+    finally:
+        conn.close()
+    return get_student(db_path, row['id']) if row else None
+
+def find_by_image(db_path: str, path: str) -> Optional[dict]:
+    """
+    Look up the student an image path belongs to.
+    """
+    conn = _connect(db_path)
+    try:
+        row = conn.execute('SELECT student_id FROM student_images WHERE path = ?', (path,)).fetchone()
+    finally:
+        conn.close()
+    return get_student(db_path, row['student_id']) if row else None
+
+def list_students(db_path: str, limit: Optional[int] = None, offset: int = 0) -> List[dict]:
+    """
+    List students with their image paths, ordered by roll number.
+
+    Args:
+        db_path (str): Path to the roster database
+        limit (int, optional): Maximum number of students, for pagination
+        offset (int): Number of students to skip
+    """
+    conn = _connect(db_path)
+    try:
+        students = conn.execute(
+            'SELECT * FROM students ORDER BY LENGTH(roll_no), roll_no, name LIMIT ? OFFSET ?',
+            (limit if limit is not None else -1, offset)
+        ).fetchall()
+        images: Dict[int, List[str]] = {}
+        ids = [student['id'] for student in students]
+        query = 'SELECT path, student_id FROM student_images'
+        if limit is not None:
+            query += f" WHERE student_id IN ({', '.join('?' * len(ids))})"
+        for row in conn.execute(query + ' ORDER BY path', ids if limit is not None else ()):
+            images.setdefault(row['student_id'], []).append(row['path'])
+    finally:
+        conn.close()
+    return [_student_from_rows(student, images.get(student['id'], [])) for student in students]
+
+def count_students(db_path: str) -> int:
+    """
+    Return the number of registered students.
+    """
+    conn = _connect(db_path)
+    try:
+        return conn.execute('SELECT COUNT(*) FROM students').fetchone()[0]
+    finally:
+        conn.close()
+
+def _is_image(filename: str) -> bool:
+    return os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS
+
+def sync_training_images(db_path: str, training_path: str):
+    """
+    Reconcile the roster with the training folder.
+
+    Images added to the folder outside the web app (a 'Roll_Name.ext' file
+    or a 'Roll_Name/' directory of photos) are registered, joining an
+    existing student with the same roll number and name when there is one.
+    A roll number already registered under another name is logged and
+    skipped rather than enrolled twice.
+
+    References to images that no longer exist are dropped, but the
+    students themselves are kept, so their ids and attendance history
+    survive a moved or renamed folder. An empty training folder is treated
+    as missing and leaves the roster untouched.
+
+    Args:
+        db_path (str): Path to the roster database
+        training_path (str): Directory containing training images
+    """
+    on_disk = {}
+    for entry in os.listdir(training_path):
+        entry_path = os.path.join(training_path, entry)
+        if os.path.isdir(entry_path):
+            stem = entry
+            files = [f"{entry}/{f}" for f in sorted(os.listdir(entry_path))
+                     if _is_image(f) and os.path.isfile(os.path.join(entry_path, f))]
+        elif _is_image(entry):
+            stem = os.path.splitext(entry)[0]
+            files = [entry]
+        else:
+            continue
+        for path in files:
+            on_disk[path] = stem
+
+    if not on_disk:
+        logger.warning(f"No images found in {training_path}; roster left unchanged")
+        return
+
+    conn = _connect(db_path)
+    try:
+        known = {row['path'] for row in conn.execute('SELECT path FROM student_images')}
+        missing = known - set(on_disk)
+        if missing:
+            with conn:
+                conn.executemany('DELETE FROM student_images WHERE path = ?', [(path,) for path in missing])
+            logger.warning(f"Dropped {len(missing)} roster images missing from {training_path}")
+    finally:
+        conn.close()
+
+    added = 0
+    for path in sorted(set(on_disk) - known):
+        name, roll_no = parse_student_name(on_disk[path])
+        if roll_no == 'N/A':
+            student = next((s for s in list_students(db_path)
+                             if s['roll_no'] == 'N/A' and s['name'].lower() == name.lower()), None)
+        else:
+            student = find_by_roll_no(db_path, roll_no)
+            if student and student['name'].lower() != name.lower():
+                logger.warning(f"Skipping {path}: roll number {roll_no} is already registered "
+                               f"to {student['name']}")
+                continue
+        if student:
+            add_image(db_path, student['id'], path)
+        else:
+            add_student(db_path, name, roll_no, [path])
+        added += 1
+
+    if added:
+        logger.info(f"Registered {added} new training images in the roster")
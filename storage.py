@@ -0,0 +1,132 @@
+import os
+import time
+import tempfile
+import logging
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+LOCK_TIMEOUT = 30  # Seconds to wait for another process before giving up
+REPLACE_TIMEOUT = 5  # Seconds to retry a replace blocked by an open reader (Windows)
+
+def _copy_mode(tmp_path: str, path: str):
+    """
+    Give the temporary file the target's permissions (mkstemp creates 0600).
+    """
+    try:
+        os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+    except FileNotFoundError:
+        os.chmod(tmp_path, 0o644)
+
+def _replace(tmp_path: str, path: str, timeout: float = REPLACE_TIMEOUT):
+    """
+    Rename tmp_path over path. On Windows the rename fails with
+    PermissionError while another process (such as a web worker reading
+    without the lock) has the target open, so retry until it is closed.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            os.replace(tmp_path, path)
+            return
+        except PermissionError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.02)
+
+@contextmanager
+def locked(path: str, timeout: float = LOCK_TIMEOUT):
+    """
+    Hold an exclusive cross-process lock for a persisted file.
+
+    The lock lives in a '<path>.lock' sidecar so the data file itself can be
+    replaced atomically while the lock is held. Every read-modify-write of a
+    shared file, from the web workers or the recognizer, goes through here.
+
+    Args:
+        path (str): Path of the file being protected
+        timeout (float): Seconds to wait before raising TimeoutError
+    """
+    lock_path = f"{path}.lock"
+    lock_dir = os.path.dirname(lock_path)
+    if lock_dir:
+        os.makedirs(lock_dir, exist_ok=True)
+
+    with open(lock_path, 'a+b') as lock_file:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if fcntl:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Timed out waiting for lock on {path}")
+                time.sleep(0.01)
+
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def atomic_write(path: str, mode: str = 'w', **open_kwargs):
+    """
+    Write a file through a temporary file in the same directory, then
+    rename it over the target, so readers see either the old or the new
+    contents and never a partial write.
+
+    Args:
+        path (str): Destination file
+        mode (str): 'w' for text or 'wb' for binary
+        **open_kwargs: Passed to open(), e.g. newline='' for CSV
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, mode, **open_kwargs) as tmp_file:
+            yield tmp_file
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+        _copy_mode(tmp_path, path)
+        _replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def atomic_save(path: str, save):
+    """
+    Atomically produce a file with a callback that writes to a given path,
+    for APIs that save by filename (uploads, Pillow, pandas).
+
+    Args:
+        path (str): Destination file
+        save: Callable taking the temporary path to write to
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    os.close(fd)
+    try:
+        save(tmp_path)
+        _copy_mode(tmp_path, path)
+        _replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
@@ -0,0 +1,79 @@
+import os
+import logging
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+from storage import atomic_save
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_FOLDER = 'thumbnails'
+# Square sizes in pixels: 'small' for tables and cards, 'large' for the upload gallery
+THUMBNAIL_SIZES = {'small': 160, 'large': 320}
+# Served formats by file extension, in order of preference
+THUMBNAIL_FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+THUMBNAIL_QUALITY = 80
+
+def thumbnail_path(image: str, size: str, ext: str, folder: str = THUMBNAIL_FOLDER) -> str:
+    """
+    Path of one derivative of a training image.
+
+    Args:
+        image (str): Image path relative to the training folder
+        size (str): Key of THUMBNAIL_SIZES
+        ext (str): Key of THUMBNAIL_FORMATS
+        folder (str): Root folder for derivatives
+    """
+    return os.path.join(folder, size, f"{image}.{ext}")
+
+def generate_thumbnails(source_path: str, image: str, folder: str = THUMBNAIL_FOLDER):
+    """
+    Write every size and format of thumbnail for a training image.
+
+    Thumbnails are cropped to a square, matching how the pages display them.
+
+    Args:
+        source_path (str): Path of the full-size image
+        image (str): Image path relative to the training folder
+        folder (str): Root folder for derivatives
+    """
+    with Image.open(source_path) as original:
+        img = ImageOps.exif_transpose(original).convert('RGB')
+
+    for size, pixels in THUMBNAIL_SIZES.items():
+        thumb = ImageOps.fit(img, (pixels, pixels), Image.LANCZOS)
+        for ext, image_format in THUMBNAIL_FORMATS.items():
+            # Several workers may render the same thumbnail; each lands atomically
+            atomic_save(thumbnail_path(image, size, ext, folder),
+                        lambda tmp_path: thumb.save(tmp_path, image_format, quality=THUMBNAIL_QUALITY))
+
+def ensure_thumbnails(source_path: str, image: str, folder: str = THUMBNAIL_FOLDER):
+    """
+    Generate thumbnails for an image if any are missing or older than it.
+    """
+    source_mtime = os.path.getmtime(source_path)
+    for size in THUMBNAIL_SIZES:
+        for ext in THUMBNAIL_FORMATS:
+            path = thumbnail_path(image, size, ext, folder)
+            if not os.path.exists(path) or os.path.getmtime(path) < source_mtime:
+                generate_thumbnails(source_path, image, folder)
+                return
+
+def remove_thumbnails(image: str, folder: str = THUMBNAIL_FOLDER):
+    """
+    Delete all derivatives of a training image.
+    """
+    for size in THUMBNAIL_SIZES:
+        for ext in THUMBNAIL_FORMATS:
+            path = thumbnail_path(image, size, ext, folder)
+            if os.path.exists(path):
+                os.remove(path)
+
+def pick_format(accept_header: Optional[str]) -> str:
+    """
+    Choose WebP when the browser advertises it, JPEG otherwise.
+    """
+    if accept_header and 'image/webp' in accept_header:
+        return 'webp'
+    return 'jpg'